@@ -0,0 +1,78 @@
+import numpy as np
+import settings
+
+class BrainBatch:
+    def __init__(self, brains):
+        self.brains = list(brains)
+        offsets = [0]
+        for brain in self.brains:
+            offsets.append(offsets[-1] + brain.num_neurons)
+        self.offsets = offsets
+        self.num_neurons = offsets[-1]
+        self.num_actions = len(self.brains) * settings.NUM_ACTIONS
+        #Sources index into [all neurons..., all sensor inputs...]
+        sensor_base = self.num_neurons
+        neuron_src, neuron_dst, neuron_weight = [], [], []
+        action_src, action_dst, action_weight = [], [], []
+        for p, brain in enumerate(self.brains):
+            offset = offsets[p]
+            sensor_offset = sensor_base + p * settings.NUM_SENSES
+            action_offset = p * settings.NUM_ACTIONS
+            #Edge order per sink matches the summation order in Brain.activate
+            for conn in brain.sensor_neuron:
+                neuron_src.append(sensor_offset + conn[1])
+                neuron_dst.append(offset + conn[3])
+                neuron_weight.append(conn[4])
+            for conn in brain.neuron_neuron:
+                neuron_src.append(offset + conn[1])
+                neuron_dst.append(offset + conn[3])
+                neuron_weight.append(conn[4])
+            for conn in brain.sensor_action:
+                action_src.append(sensor_offset + conn[1])
+                action_dst.append(action_offset + conn[3])
+                action_weight.append(conn[4])
+            for conn in brain.neuron_action:
+                action_src.append(offset + conn[1])
+                action_dst.append(action_offset + conn[3])
+                action_weight.append(conn[4])
+        self.neuron_src = np.array(neuron_src, dtype=np.intp)
+        self.neuron_dst = np.array(neuron_dst, dtype=np.intp)
+        self.neuron_weight = np.array(neuron_weight, dtype=np.float64)
+        self.action_src = np.array(action_src, dtype=np.intp)
+        self.action_dst = np.array(action_dst, dtype=np.intp)
+        self.action_weight = np.array(action_weight, dtype=np.float64)
+        self.connection_count = 2 * len(self.neuron_src) + len(self.action_src)
+        self.neurons = np.zeros(self.num_neurons)
+        for p, brain in enumerate(self.brains):
+            self.neurons[offsets[p]:offsets[p + 1]] = brain.neurons
+        #Neurons of acyclic brains, which the topological mode recomputes from zero each step
+        self.acyclic = np.zeros(self.num_neurons, dtype=bool)
+        self.levels = 0
+        for p, brain in enumerate(self.brains):
+            if brain.wiring.order is not None:
+                self.acyclic[offsets[p]:offsets[p + 1]] = True
+                self.levels = max(self.levels, brain.wiring.levels)
+
+    def activate(self, sensor_inputs, iterations=2):
+        sensors = np.asarray(sensor_inputs, dtype=np.float64)
+        if sensors.shape[1] < settings.NUM_SENSES:
+            sensors = np.pad(sensors, ((0, 0), (0, settings.NUM_SENSES - sensors.shape[1])))
+        total = iterations
+        if settings.EVALUATION_MODE == 'topological' and self.levels:
+            #Sweeping an acyclic brain from zero settles one level per sweep, which gives the single-pass result;
+            #recurrent brains keep their state after the usual iterations
+            self.neurons = np.where(self.acyclic, 0.0, self.neurons)
+            total = max(iterations, self.levels)
+        values = np.concatenate((self.neurons, sensors.reshape(-1)))
+        for sweep in range(total):
+            contrib = values[self.neuron_src] * self.neuron_weight
+            neurons = np.tanh(np.bincount(self.neuron_dst, contrib, minlength=self.num_neurons))
+            self.neurons = neurons if sweep < iterations else np.where(self.acyclic, neurons, self.neurons)
+            values[:self.num_neurons] = self.neurons
+        contrib = values[self.action_src] * self.action_weight
+        actions = np.bincount(self.action_dst, contrib, minlength=self.num_actions)
+        return np.tanh(actions).reshape(-1, settings.NUM_ACTIONS)
+
+    def store_neurons(self):
+        for p, brain in enumerate(self.brains):
+            brain.neurons = self.neurons[self.offsets[p]:self.offsets[p + 1]].tolist()
@@ -0,0 +1,184 @@
+import argparse
+import json
+import platform
+import random
+import time
+from contextlib import contextmanager
+import numpy as np
+import settings
+from brain import Brain, brain_cache
+from genome import make_random_genome, reproduce_genome, make_random_genomes, reproduce_genomes
+from individual import Individual
+from population_store import PopulationStore
+from simulation import Simulation
+from sensors import get_sensor_inputs, get_population_sensor_inputs, get_store_sensor_inputs
+
+SEED = 1234
+
+@contextmanager
+def overrides(**values):
+    saved = {name: getattr(settings, name) for name in values}
+    for name, value in values.items():
+        setattr(settings, name, value)
+    try:
+        yield
+    finally:
+        for name, value in saved.items():
+            setattr(settings, name, value)
+
+def measure(func, number, repeat):
+    #Best of repeat runs, in nanoseconds per call
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter_ns()
+        for _ in range(number):
+            func()
+        elapsed = (time.perf_counter_ns() - start) / number
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+def bench_activate(genome_length, repeat):
+    random.seed(SEED)
+    with overrides(GENOME_LENGTH=genome_length):
+        brains = [Brain(make_random_genome()) for _ in range(100)]
+    inputs = [[random.uniform(-1, 1) for _ in range(settings.NUM_SENSES)] for _ in brains]
+    pairs = list(zip(brains, inputs))
+    return measure(lambda: [brain.activate(sensors) for brain, sensors in pairs], 10, repeat) / len(pairs)
+
+def bench_activate_compiled(genome_length, repeat):
+    random.seed(SEED)
+    with overrides(GENOME_LENGTH=genome_length):
+        brains = [Brain(make_random_genome()) for _ in range(100)]
+    inputs = [[random.uniform(-1, 1) for _ in range(settings.NUM_SENSES)] for _ in brains]
+    pairs = list(zip(brains, inputs))
+    with overrides(COMPILE_BRAINS=True):
+        return measure(lambda: [brain.run(sensors) for brain, sensors in pairs], 10, repeat) / len(pairs)
+
+def chain_genome(length):
+    #Neuron chain listed sink-first, the worst order for a rescanning fixed point
+    genome = [[settings.NEURON, i, settings.NEURON, i + 1, 0.5] for i in reversed(range(length))]
+    genome.append([settings.SENSOR, 0, settings.NEURON, 0, 0.5])
+    genome.append([settings.NEURON, length, settings.ACTION, 0, 0.5])
+    return genome
+
+def bench_cull(length, repeat):
+    genome = chain_genome(length)
+    brain = Brain.__new__(Brain)
+    return measure(lambda: brain.cull_unused_neurons(genome), 5, repeat)
+
+def make_population(size):
+    random.seed(SEED)
+    store = PopulationStore(size)
+    with overrides(POPULATION_SIZE=size):
+        return [Individual(x=random.randint(1, 99), y=random.randint(1, 99), store=store, index=index) for index in range(size)]
+
+def bench_sensors(size, repeat):
+    population = make_population(size)
+    return measure(lambda: [get_sensor_inputs(ind, population, 0) for ind in population], 1, repeat)
+
+def bench_population_sensors(size, repeat):
+    population = make_population(size)
+    return measure(lambda: get_population_sensor_inputs(population, 0), 3, repeat)
+
+def bench_reproduce(genome_length, repeat):
+    random.seed(SEED)
+    with overrides(GENOME_LENGTH=genome_length):
+        genomes = [make_random_genome() for _ in range(200)]
+    return measure(lambda: [reproduce_genome(genome) for genome in genomes], 3, repeat) / len(genomes)
+
+def bench_reproduce_packed(genome_length, repeat):
+    random.seed(SEED)
+    with overrides(GENOME_LENGTH=genome_length):
+        genomes = make_random_genomes(2000)
+    return measure(lambda: reproduce_genomes(genomes), 3, repeat) / len(genomes)
+
+def bench_generation(population_size, genome_length, batch, repeat):
+    #One full generation: GENERATION_STEPS steps plus selection and reproduction
+    with overrides(POPULATION_SIZE=population_size, GENOME_LENGTH=genome_length, BATCH_BRAIN=batch,
+                   PRINT_GENERATION=False, WRITE_GENOME=False, GENERATION_STEPS=20):
+        def run():
+            random.seed(SEED)
+            brain_cache.clear()
+            sim = Simulation()
+            sensor_callback = lambda ind: get_sensor_inputs(ind, sim.population, sim.current_step, ind.brain.sensor_usage)
+            store_sensor_callback = lambda store: get_store_sensor_inputs(store, sim.current_step)
+            for _ in range(settings.GENERATION_STEPS):
+                sim.update(settings.GENERATION_STEPS, sensor_callback=sensor_callback,
+                           store_sensor_callback=store_sensor_callback)
+        return measure(run, 1, repeat)
+
+def run_benchmarks(quick=False):
+    repeat = 3 if quick else 5
+    results = {}
+    def record(name, param, value, func, *args):
+        key = f"{name}/{param}={value}"
+        results[key] = {"benchmark": name, "param": param, "value": value, "ns": func(*args, repeat)}
+        print(f"{key:48s} {results[key]['ns'] / 1e3:12.1f} us")
+    for length in (10, 40, 160):
+        record("activate", "GENOME_LENGTH", length, bench_activate, length)
+        record("activate_compiled", "GENOME_LENGTH", length, bench_activate_compiled, length)
+    for length in (50, 200, 800):
+        record("cull_chain", "length", length, bench_cull, length)
+    for size in (20, 100, 400):
+        record("get_sensor_inputs", "POPULATION_SIZE", size, bench_sensors, size)
+    for size in (20, 400, 2000, 10000):
+        record("get_population_sensor_inputs", "POPULATION_SIZE", size, bench_population_sensors, size)
+    for length in (10, 40, 160):
+        record("reproduce_genome", "GENOME_LENGTH", length, bench_reproduce, length)
+        record("reproduce_genomes_packed", "GENOME_LENGTH", length, bench_reproduce_packed, length)
+    for size in ((20, 50, 100) if quick else (20, 50, 100, 200)):
+        record("generation", "POPULATION_SIZE", size, lambda s, r: bench_generation(s, settings.GENOME_LENGTH, False, r), size)
+    for size in ((100, 1000) if quick else (100, 1000, 5000)):
+        record("generation_batched", "POPULATION_SIZE", size, lambda s, r: bench_generation(s, settings.GENOME_LENGTH, True, r), size)
+    for length in (20, 40, 80):
+        record("generation", "GENOME_LENGTH", length, lambda l, r: bench_generation(settings.POPULATION_SIZE, l, False, r), length)
+    return results
+
+def print_scaling(results):
+    curves = {}
+    for result in results.values():
+        curves.setdefault((result["benchmark"], result["param"]), []).append(result)
+    print("\nScaling")
+    for (name, param), points in curves.items():
+        points.sort(key=lambda r: r["value"])
+        base = points[0]
+        curve = ", ".join(f"{r['value']}: x{r['ns'] / base['ns']:.1f}" for r in points)
+        print(f"  {name} over {param}: {curve}")
+
+def compare(results, baseline, threshold):
+    regressions = []
+    print(f"\nCompared with baseline (threshold x{threshold})")
+    for key, result in results.items():
+        if key not in baseline:
+            continue
+        ratio = result["ns"] / baseline[key]["ns"]
+        flag = "REGRESSION" if ratio > threshold else "faster" if ratio < 1 / threshold else ""
+        print(f"  {key:48s} x{ratio:5.2f} {flag}")
+        if ratio > threshold:
+            regressions.append(key)
+    return regressions
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Benchmark the simulation hot paths")
+    parser.add_argument("--output", default="benchmark.json")
+    parser.add_argument("--baseline", help="earlier --output file to compare against")
+    parser.add_argument("--threshold", type=float, default=1.25, help="slowdown ratio flagged as a regression")
+    parser.add_argument("--quick", action="store_true")
+    return parser.parse_args()
+
+def main():
+    args = parse_args()
+    results = run_benchmarks(args.quick)
+    print_scaling(results)
+    with open(args.output, "w") as f:
+        json.dump({"meta": {"python": platform.python_version(), "numpy": np.__version__, "seed": SEED},
+                   "results": results}, f, indent=1)
+    print(f"\nResults written to {args.output}")
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)["results"]
+        if compare(results, baseline, args.threshold):
+            raise SystemExit(1)
+
+if __name__ == "__main__":
+    main()
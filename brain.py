@@ -1,19 +1,191 @@
 import math
+from bisect import bisect_left
+from collections import OrderedDict
 import settings
+from genome import unpack_genome
+from brain_compiler import compile_wiring
+from genome_graph import driven_neurons, reachable, strongly_connected_components
+
+class Wiring:
+    #Compiled connections of a culled, remapped genome; shared by brains with equal genomes
+    def __init__(self, key, num_neurons):
+        self.key = key
+        self.num_neurons = num_neurons
+        self.sensor_neuron = [g for g in key if g[2] == settings.NEURON and g[0] == settings.SENSOR]
+        self.neuron_neuron = [g for g in key if g[2] == settings.NEURON and g[0] == settings.NEURON]
+        self.sensor_action = [g for g in key if g[2] == settings.ACTION and g[0] == settings.SENSOR]
+        self.neuron_action = [g for g in key if g[2] == settings.ACTION and g[0] == settings.NEURON]
+        self.sensor_usage = frozenset(g[1] for g in self.sensor_neuron + self.sensor_action)
+        #Connections evaluated by one activate call with the default two iterations
+        self.connection_count = 2 * (len(self.sensor_neuron) + len(self.neuron_neuron)) + len(self.sensor_action) + len(self.neuron_action)
+        self.inputs = tuple(sorted(self.sensor_usage))
+        self.kind = self.classify()
+        self.order, self.levels = self.topological_order()
+        if self.order is not None:
+            #(neuron, sensor terms, neuron terms) in evaluation order, terms in the summation order of activate
+            self.plan = [(j, [(g[1], g[4]) for g in self.sensor_neuron if g[3] == j],
+                          [(g[1], g[4]) for g in self.neuron_neuron if g[3] == j]) for j in self.order]
+        #Sensor values -> (actions, neurons) for brains whose activation ignores the previous neuron state
+        self.memo = {}
+        #Generated activation, built on first use when COMPILE_BRAINS is set; False when it cannot be compiled
+        self.compiled = None
+
+    def classify(self):
+        #Neurons start at 0.0 and only become nonzero along a path from a sensor
+        successors = {}
+        for g in self.neuron_neuron:
+            successors.setdefault(g[1], []).append(g[3])
+        live = reachable([g[3] for g in self.sensor_neuron], successors)
+        #Two iterations carry the previous state as far as neurons two hops from a live neuron
+        first_hop = {g[3] for g in self.neuron_neuron if g[1] in live}
+        if any(g[1] in first_hop for g in self.neuron_neuron):
+            return 'recurrent'
+        if not self.inputs:
+            return 'constant'
+        return 'stateless'
+
+    def topological_order(self):
+        #Neuron order in which every source comes before its sinks and the number of levels, or (None, 0) with a cycle
+        successors = {}
+        for g in self.neuron_neuron:
+            if g[1] == g[3]:
+                return None, 0
+            successors.setdefault(g[1], []).append(g[3])
+        components = strongly_connected_components(range(self.num_neurons), successors)
+        if len(components) != self.num_neurons:
+            return None, 0
+        order = [component[0] for component in reversed(components)]
+        level = [1] * self.num_neurons
+        for j in order:
+            for k in successors.get(j, ()):
+                level[k] = max(level[k], level[j] + 1)
+        return order, max(level, default=0)
+
+class BrainCache:
+    def __init__(self):
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, num_neurons):
+        wiring = self.entries.get(key)
+        if wiring is not None:
+            self.hits += 1
+            self.entries.move_to_end(key)
+            return wiring
+        self.misses += 1
+        wiring = Wiring(key, num_neurons)
+        if settings.BRAIN_CACHE_SIZE > 0:
+            self.entries[key] = wiring
+            while len(self.entries) > settings.BRAIN_CACHE_SIZE:
+                self.entries.popitem(last=False)
+        return wiring
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {"hits": self.hits, "misses": self.misses, "size": len(self.entries),
+                "hit_rate": self.hits / lookups if lookups else 0.0}
+
+    def clear(self):
+        self.entries.clear()
+        self.hits = 0
+        self.misses = 0
+
+brain_cache = BrainCache()
 
 class Brain:
     def __init__(self, genome, cull=True):
-        self.genome = self.cull_unused_neurons(genome) if cull else genome
+        genome = unpack_genome(genome)
+        if cull:
+            self.driven = self.find_driven(genome)
+            self.kept = self.kept_indices(genome, self.driven)
+        else:
+            self.driven = None
+            self.kept = list(range(len(genome)))
+        #Remap private copies so the individual's genome keeps its own neuron ids
+        self.genome = [list(genome[i]) for i in self.kept]
         self.remap_neurons()
         self.build_wiring()
         self.neurons = [0.0] * self.num_neurons
 
+    @classmethod
+    def from_parent(cls, parent, genome, delta):
+        brain = cls.__new__(cls)
+        if not brain.apply_delta(parent, delta):
+            return cls(genome)
+        if brain.genome is parent.genome:
+            brain.wiring = parent.wiring
+            brain.sensor_neuron = parent.sensor_neuron
+            brain.neuron_neuron = parent.neuron_neuron
+            brain.sensor_action = parent.sensor_action
+            brain.neuron_action = parent.neuron_action
+        else:
+            brain.build_wiring()
+        brain.neurons = [0.0] * brain.num_neurons
+        return brain
+
+    @property
+    def sensor_usage(self):
+        return self.wiring.sensor_usage
+
+    def apply_delta(self, parent, delta):
+        #Returns False when the mutation may change which neurons are driven or how they are numbered
+        if parent.driven is None:
+            return False
+        kept, genome, driven, neuron_ids = parent.kept, parent.genome, parent.driven, parent.neuron_ids
+        for op in delta:
+            index = op[1]
+            position = bisect_left(kept, index)
+            is_kept = position < len(kept) and kept[position] == index
+            if op[0] == 'edit':
+                old, new = op[2], op[3]
+                if old[:4] != new[:4]:
+                    return False
+                if is_kept:
+                    genome = genome[:]
+                    genome[position] = genome[position][:4] + [new[4]]
+            elif op[0] == 'add':
+                gene = op[2]
+                if gene[0] == settings.NEURON and gene[2] == settings.ACTION:
+                    if gene[1] in neuron_ids:
+                        kept = kept + [index]
+                        genome = genome + [[settings.NEURON, neuron_ids[gene[1]], settings.ACTION, gene[3], gene[4]]]
+                    elif gene[1] in driven:
+                        return False
+                elif gene[0] == settings.SENSOR and gene[2] == settings.NEURON:
+                    #mutate_genome only adds sensor genes into a fresh neuron id above all others
+                    if gene[3] in driven or (neuron_ids and gene[3] < next(reversed(neuron_ids))):
+                        return False
+                    if gene[1] != gene[3]:
+                        driven = driven | {gene[3]}
+                        neuron_ids = dict(neuron_ids)
+                        neuron_ids[gene[3]] = len(neuron_ids)
+                        kept = kept + [index]
+                        genome = genome + [[settings.SENSOR, gene[1], settings.NEURON, neuron_ids[gene[3]], gene[4]]]
+                else:
+                    return False
+            elif op[0] == 'remove':
+                if op[2][2] == settings.NEURON:
+                    return False
+                if is_kept:
+                    removed = genome[position]
+                    genome = genome[:position] + genome[position + 1:]
+                    if removed[0] == settings.NEURON and not any(
+                            (g[0] == settings.NEURON and g[1] == removed[1]) or (g[2] == settings.NEURON and g[3] == removed[1])
+                            for g in genome):
+                        return False
+                kept = kept[:position] + [k - 1 for k in kept[position + is_kept:]]
+        self.kept, self.genome, self.driven, self.neuron_ids = kept, genome, driven, neuron_ids
+        self.num_neurons = len(neuron_ids)
+        return True
+
     def remap_neurons(self):
         src_neurons = [g[1] for g in self.genome if g[0] == settings.NEURON]
         sink_neurons = [g[3] for g in self.genome if g[2] == settings.NEURON]
         all_neurons = sorted(set(src_neurons + sink_neurons))
         self.num_neurons = len(all_neurons)
         remap_dict = {old: new for new, old in enumerate(all_neurons)}
+        self.neuron_ids = remap_dict
         for gene in self.genome:
             if gene[0] == settings.NEURON:
                 gene[1] = remap_dict[gene[1]]
@@ -21,10 +193,11 @@ class Brain:
                 gene[3] = remap_dict[gene[3]]
 
     def build_wiring(self):
-        self.sensor_neuron = [g for g in self.genome if g[2] == settings.NEURON and g[0] == settings.SENSOR]
-        self.neuron_neuron = [g for g in self.genome if g[2] == settings.NEURON and g[0] == settings.NEURON]
-        self.sensor_action = [g for g in self.genome if g[2] == settings.ACTION and g[0] == settings.SENSOR]
-        self.neuron_action = [g for g in self.genome if g[2] == settings.ACTION and g[0] == settings.NEURON]
+        self.wiring = brain_cache.get(tuple(map(tuple, self.genome)), self.num_neurons)
+        self.sensor_neuron = self.wiring.sensor_neuron
+        self.neuron_neuron = self.wiring.neuron_neuron
+        self.sensor_action = self.wiring.sensor_action
+        self.neuron_action = self.wiring.neuron_action
 
     def activate(self, sensor_inputs, iterations=2):
         sensor_inputs = list(sensor_inputs)
@@ -46,25 +219,66 @@ class Brain:
             actions[conn[3]] += val
         return [math.tanh(x) for x in actions]
 
+    def evaluate(self, sensor_inputs):
+        #Same result and neuron state as activate, looked up when the state cannot affect it
+        wiring = self.wiring
+        if settings.EVALUATION_MODE == 'topological' and wiring.order is not None:
+            return self.activate_topological(sensor_inputs)
+        if wiring.kind == 'recurrent' or not settings.BRAIN_MEMO_SIZE:
+            return self.run(sensor_inputs)
+        key = tuple([sensor_inputs[s] for s in wiring.inputs])
+        entry = wiring.memo.get(key)
+        if entry is None:
+            actions = self.run(sensor_inputs)
+            if len(wiring.memo) < settings.BRAIN_MEMO_SIZE:
+                wiring.memo[key] = (tuple(actions), self.neurons)
+            return actions
+        self.neurons = entry[1]
+        return list(entry[0])
+
+    def run(self, sensor_inputs):
+        #activate with the default two iterations, through generated code when COMPILE_BRAINS is set
+        if settings.COMPILE_BRAINS:
+            wiring = self.wiring
+            if wiring.compiled is None:
+                wiring.compiled = compile_wiring(wiring) or False
+            if wiring.compiled:
+                actions, self.neurons = wiring.compiled(sensor_inputs, self.neurons)
+                return actions
+        return self.activate(sensor_inputs)
+
+    def activate_topological(self, sensor_inputs):
+        #Acyclic wiring only: every neuron is evaluated once, after all of its sources, from this step's senses
+        neurons = [0.0] * self.num_neurons
+        for j, sensor_terms, neuron_terms in self.wiring.plan:
+            total = 0.0
+            for source, weight in sensor_terms:
+                total += sensor_inputs[source] * weight
+            for source, weight in neuron_terms:
+                total += neurons[source] * weight
+            neurons[j] = math.tanh(total)
+        self.neurons = neurons
+        actions = [0.0] * settings.NUM_ACTIONS
+        for conn in self.sensor_action:
+            actions[conn[3]] += sensor_inputs[conn[1]] * conn[4]
+        for conn in self.neuron_action:
+            actions[conn[3]] += neurons[conn[1]] * conn[4]
+        return [math.tanh(x) for x in actions]
+
     def cull_unused_neurons(self, genome):
-        driven = set()
-        for row in genome:
-            if row[2] == settings.NEURON and row[0] in (settings.SENSOR, settings.NEURON) and row[1] != row[3]:
-                driven.add(row[3])
-        changed = True
-        while changed:
-            changed = False
-            for row in genome:
-                if row[2] == settings.NEURON and row[0] == settings.NEURON and row[1] in driven and row[3] not in driven:
-                    driven.add(row[3])
-                    changed = True
+        return [genome[i] for i in self.kept_indices(genome, self.find_driven(genome))]
+
+    def find_driven(self, genome):
+        return driven_neurons(genome)
+
+    def kept_indices(self, genome, driven):
         valid = []
-        for row in genome:
+        for i, row in enumerate(genome):
             if row[2] == settings.ACTION:
                 if row[0] == settings.SENSOR or row[1] in driven:
-                    valid.append(row)
+                    valid.append(i)
             elif row[2] == settings.NEURON:
                 if row[3] in driven and (row[0] == settings.SENSOR or row[1] in driven):
-                    valid.append(row)
+                    valid.append(i)
         return valid
 
@@ -0,0 +1,148 @@
+import argparse
+import math
+import random
+from collections import OrderedDict
+import settings
+
+#(genome key, merge) -> generated activation function, shared by every wiring with that genome
+compiled_cache = OrderedDict()
+source_cache = {}
+
+def group_terms(conns, sinks, merge):
+    #Per sink, (source, weight) in gene order; merging folds repeated source-sink pairs into one weight
+    terms = [[] for _ in range(sinks)]
+    for conn in conns:
+        sink_terms = terms[conn[3]]
+        if merge:
+            for k, (source, weight) in enumerate(sink_terms):
+                if source == conn[1]:
+                    sink_terms[k] = (source, weight + conn[4])
+                    break
+            else:
+                sink_terms.append((conn[1], conn[4]))
+        else:
+            sink_terms.append((conn[1], conn[4]))
+    #A finite input times 0.0 is a signed zero, which never changes a sum that starts at 0.0
+    return [[term for term in sink_terms if term[1] != 0.0] for sink_terms in terms]
+
+def sum_expression(parts):
+    #Left to right from 0.0, the same order and rounding as the interpreted accumulation;
+    #a shared partial sum already started from 0.0
+    if parts and parts[0].startswith("p"):
+        return " + ".join(parts)
+    return " + ".join(["0.0"] + parts)
+
+def generate_source(wiring, merge=False):
+    num_neurons = wiring.num_neurons
+    sensor_terms = group_terms(wiring.sensor_neuron, num_neurons, merge)
+    neuron_terms = group_terms(wiring.neuron_neuron, num_neurons, merge)
+    sensor_action_terms = group_terms(wiring.sensor_action, settings.NUM_ACTIONS, merge)
+    neuron_action_terms = group_terms(wiring.neuron_action, settings.NUM_ACTIONS, merge)
+    lines = ["def activate(s, n, tanh=tanh):"]
+    senses = sorted({source for terms in sensor_terms + sensor_action_terms for source, _ in terms})
+    lines += [f"    s{i} = s[{i}]" for i in senses]
+    #Sensor terms come first in every sum, so both iterations share the same partial sum
+    partial = {}
+    for j, terms in enumerate(sensor_terms):
+        if terms and neuron_terms[j]:
+            lines.append(f"    p{j} = {sum_expression([f's{i} * {w!r}' for i, w in terms])}")
+            partial[j] = [f"p{j}"]
+        else:
+            partial[j] = [f"s{i} * {w!r}" for i, w in terms]
+    #First iteration reads the previous state; neurons without inputs settle at 0.0
+    first = {}
+    for j in range(num_neurons):
+        parts = partial[j] + [f"n[{i}] * {w!r}" for i, w in neuron_terms[j]]
+        if parts:
+            lines.append(f"    a{j} = tanh({sum_expression(parts)})")
+            first[j] = f"a{j}"
+    #Second iteration; neurons fed only by sensors repeat their first value
+    second = {}
+    for j in range(num_neurons):
+        parts = [f"{first[i]} * {w!r}" for i, w in neuron_terms[j] if i in first]
+        if not neuron_terms[j]:
+            if j in first:
+                second[j] = first[j]
+        elif partial[j] or parts:
+            lines.append(f"    b{j} = tanh({sum_expression(partial[j] + parts)})")
+            second[j] = f"b{j}"
+    actions = []
+    for k in range(settings.NUM_ACTIONS):
+        parts = [f"s{i} * {w!r}" for i, w in sensor_action_terms[k]]
+        parts += [f"{second[i]} * {w!r}" for i, w in neuron_action_terms[k] if i in second]
+        actions.append(f"tanh({sum_expression(parts)})" if parts else "0.0")
+    neurons = [second.get(j, "0.0") for j in range(num_neurons)]
+    lines.append(f"    return [{', '.join(actions)}], [{', '.join(neurons)}]")
+    return "\n".join(lines) + "\n"
+
+def compile_wiring(wiring, merge=False):
+    #Returns activate(sensor_inputs, neurons) -> (actions, neurons) for the default two iterations
+    key = (wiring.key, merge)
+    function = compiled_cache.get(key)
+    if function is not None:
+        compiled_cache.move_to_end(key)
+        return function
+    if not all(math.isfinite(conn[4]) for conn in wiring.key):
+        return None
+    source = generate_source(wiring, merge)
+    namespace = {"tanh": math.tanh}
+    exec(compile(source, f"<brain {hash(key) & 0xffffffff:08x}>", "exec"), namespace)
+    function = namespace["activate"]
+    if settings.BRAIN_CACHE_SIZE > 0:
+        compiled_cache[key] = function
+        source_cache[key] = source
+        while len(compiled_cache) > settings.BRAIN_CACHE_SIZE:
+            evicted, _ = compiled_cache.popitem(last=False)
+            source_cache.pop(evicted, None)
+    return function
+
+def check_equivalence(brain, sensor_rows, merge=False):
+    #Runs the interpreted and compiled activation side by side; returns the largest difference in actions or neuron state
+    function = compile_wiring(brain.wiring, merge)
+    reference = list(brain.neurons)
+    state = list(brain.neurons)
+    saved = brain.neurons
+    largest = 0.0
+    try:
+        for sensors in sensor_rows:
+            brain.neurons = reference
+            expected = brain.activate(sensors)
+            reference = brain.neurons
+            actions, state = function(sensors, state)
+            for a, b in zip(expected + reference, actions + state):
+                if a != b or math.copysign(1.0, a) != math.copysign(1.0, b):
+                    largest = max(largest, abs(a - b), 5e-324)
+    finally:
+        brain.neurons = saved
+    return largest
+
+def main():
+    from brain import Brain
+    from genome import make_random_genome, reproduce_genome
+    parser = argparse.ArgumentParser(description="Check compiled brains against the interpreted activation")
+    parser.add_argument("--genomes", type=int, default=1000)
+    parser.add_argument("--steps", type=int, default=20)
+    parser.add_argument("--mutations", type=int, default=20, help="Mutation rounds applied to each random genome at most")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--merge", action="store_true", help="Merge duplicate connections, which is exact only up to rounding")
+    parser.add_argument("--show", action="store_true", help="Print the generated source of the first genome")
+    args = parser.parse_args()
+    random.seed(args.seed)
+    mismatches = 0
+    largest = 0.0
+    for g in range(args.genomes):
+        genome = make_random_genome()
+        for _ in range(random.randint(0, args.mutations)):
+            genome = reproduce_genome(genome)
+        brain = Brain(genome)
+        if args.show and g == 0:
+            print(generate_source(brain.wiring, args.merge))
+        rows = [[random.uniform(-1, 1) for _ in range(settings.NUM_SENSES)] for _ in range(args.steps)]
+        difference = check_equivalence(brain, rows, args.merge)
+        if difference:
+            mismatches += 1
+            largest = max(largest, difference)
+    print(f"{args.genomes} genomes, {mismatches} differ from the interpreted activation, largest difference {largest:.3g}")
+
+if __name__ == "__main__":
+    main()
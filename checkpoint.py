@@ -0,0 +1,133 @@
+import os
+import copy
+import random
+import struct
+import itertools
+import numpy as np
+import settings
+from simulation import Simulation
+from individual import Individual
+from population_store import PopulationStore
+from brain import Brain
+from genome import GENE_DTYPE, concatenate_genomes
+from log_stream import trim_generation_log
+
+MAGIC = b'BIOSIMCK'
+VERSION = 3
+#magic, version, rng version, generation, step, survival rate, training stage, individuals, genes, neurons, packed genomes, has gauss_next, gauss_next
+HEADER = struct.Struct('<8sIIQQdIQQQ??d')
+RNG_WORDS = 625
+
+def aligned(size):
+    return (size + 7) & ~7
+
+def save_checkpoint(sim, path):
+    if sim.stepper is not None:
+        sim.stepper.store_neurons()
+    population = sim.population
+    genome_offsets = np.zeros(len(population) + 1, dtype=np.int64)
+    genome_offsets[1:] = np.cumsum([len(ind.genome) for ind in population])
+    gene_count = int(genome_offsets[-1])
+    packed = settings.PACKED_GENOME
+    if packed:
+        genes = concatenate_genomes(ind.genome for ind in population)
+    else:
+        #One conversion of every gene at once; iterating value by value dominated the save
+        flat = np.array(list(itertools.chain.from_iterable(ind.genome for ind in population)), dtype=np.float64).reshape(gene_count, 5)
+        genes = np.empty(gene_count, dtype=GENE_DTYPE)
+        for column, name in enumerate(GENE_DTYPE.names):
+            genes[name] = flat[:, column]
+    store = sim.store
+    motion = np.stack([store.x, store.y, store.last_dx, store.last_dy])
+    if sim.brain_batch is not None:
+        #The batch already holds every neuron in population order
+        neuron_offsets = np.asarray(sim.brain_batch.offsets, dtype=np.int64)
+        neurons = sim.brain_batch.neurons
+    else:
+        neuron_offsets = np.zeros(len(population) + 1, dtype=np.int64)
+        neuron_offsets[1:] = np.cumsum([len(ind.brain.neurons) for ind in population])
+        neurons = np.array(list(itertools.chain.from_iterable(ind.brain.neurons for ind in population)), dtype=np.float64)
+    rng_version, rng_state, gauss_next = random.getstate()
+    header = HEADER.pack(MAGIC, VERSION, rng_version, sim.generation, sim.current_step, sim.survival_rate,
+                         sim.training_stage, len(population), gene_count, len(neurons), packed,
+                         gauss_next is not None, gauss_next or 0.0)
+    sections = [np.array(rng_state, dtype=np.uint32), motion, store.ids, genome_offsets, genes, neuron_offsets, neurons]
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(header)
+        f.write(b'\0' * (aligned(len(header)) - len(header)))
+        for section in sections:
+            data = section.tobytes()
+            f.write(data)
+            f.write(b'\0' * (aligned(len(data)) - len(data)))
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+def read_header(path, data=None):
+    #(magic, version, rng version, generation, step, survival rate, training stage, individuals, genes, neurons,
+    #packed genomes, has gauss_next, gauss_next)
+    if data is None:
+        with open(path, 'rb') as f:
+            data = f.read(HEADER.size)
+    header = HEADER.unpack(bytes(data[:HEADER.size]))
+    if header[0] != MAGIC or header[1] != VERSION:
+        raise ValueError(f"{path} is not a version {VERSION} checkpoint")
+    return header
+
+def checkpoint_population(path):
+    return read_header(path)[7]
+
+def load_checkpoint(path):
+    data = np.memmap(path, dtype=np.uint8, mode='r')
+    (magic, version, rng_version, generation, current_step, survival_rate, training_stage,
+     count, gene_count, neuron_count, packed, has_gauss, gauss_next) = read_header(path, data)
+    offset = aligned(HEADER.size)
+    def section(dtype, length):
+        nonlocal offset
+        dtype = np.dtype(dtype)
+        view = data[offset:offset + dtype.itemsize * length].view(dtype)
+        offset += aligned(dtype.itemsize * length)
+        return view
+    rng_state = section(np.uint32, RNG_WORDS)
+    motion = section(np.int64, 4 * count).reshape(4, count)
+    ids = section(np.int64, count)
+    genome_offsets = section(np.int64, count + 1).tolist()
+    genes = np.array(section(GENE_DTYPE, gene_count))
+    #Genomes are slices of one population-wide copy: array views when packed, list slices otherwise
+    gene_lists = None if packed else [list(gene) for gene in genes.tolist()]
+    raw = genes.tobytes()
+    neuron_offsets = section(np.int64, count + 1).tolist()
+    neurons = section(np.float64, neuron_count).tolist()
+    settings.POPULATION_SIZE = count
+    store = PopulationStore(count)
+    population = []
+    #Offspring often repeat a genome, and brains built from equal genomes differ only in neuron state
+    brains = {}
+    for i in range(count):
+        start, end = genome_offsets[i], genome_offsets[i + 1]
+        genome = genes[start:end] if packed else gene_lists[start:end]
+        key = raw[start * GENE_DTYPE.itemsize:end * GENE_DTYPE.itemsize]
+        template = brains.get(key)
+        if template is None:
+            brain = brains[key] = Brain(genome)
+        else:
+            brain = copy.copy(template)
+        brain.neurons = neurons[neuron_offsets[i]:neuron_offsets[i + 1]]
+        population.append(Individual(genome=genome, brain=brain, store=store, index=i))
+    store.x[:], store.y[:], store.last_dx[:], store.last_dy[:] = motion
+    store.ids[:] = ids
+    if settings.WRITE_GENOME:
+        trim_generation_log(settings.log_file, generation)
+    #Ids carry on from the saved run, so lineage continues through the resume
+    sim = Simulation(population=population, registered=True)
+    sim.generation = generation
+    sim.current_step = current_step
+    sim.survival_rate = survival_rate
+    sim.training_stage = training_stage
+    random.setstate((rng_version, tuple(rng_state.tolist()), gauss_next if has_gauss else None))
+    return sim
+
+def maybe_checkpoint(sim):
+    if settings.CHECKPOINT_INTERVAL and sim.current_step == 0 and sim.generation % settings.CHECKPOINT_INTERVAL == 0:
+        save_checkpoint(sim, settings.checkpoint_file)
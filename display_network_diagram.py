@@ -1,32 +1,20 @@
 import tkinter as tk
 from tkinter import ttk
-import random
 import math
 import ast
-from itertools import combinations
+import sys
 import settings
+from log_stream import read_generation_log
+from network_layout import build_graph, compute_clusters, cluster_has_sensor_and_action, layout_graph, TYPE_COLORS, NODE_RADIUS
 
 class GraphApp:
     def __init__(self, conn_list, canvas_width=1200, canvas_height=1000):
         self.canvas_width = canvas_width
         self.canvas_height = canvas_height
         self.conn_list = conn_list
-        self.nodes = set()
-        self.edges = []
-        self.weights = {}
-        added_edges = set()
-        for s_type, s_id, t_type, t_id, weight in conn_list:
-            src = (s_type, s_id)
-            tgt = (t_type, t_id)
-            self.nodes.add(src)
-            self.nodes.add(tgt)
-            edge = (src, tgt)
-            if edge not in added_edges:
-                self.edges.append(edge)
-                added_edges.add(edge)
-            self.weights[edge] = weight
-        self.type_colors = {settings.SENSOR: "#fdd835", settings.NEURON: "#64b5f6", settings.ACTION: "#ef5350"}
-        self.node_radius = 14
+        self.nodes, self.edges, self.weights = build_graph(conn_list)
+        self.type_colors = TYPE_COLORS
+        self.node_radius = NODE_RADIUS
         self.setup_ui()
 
     def setup_ui(self):
@@ -50,43 +38,15 @@ class GraphApp:
         self.root.mainloop()
 
     def compute_clusters(self):
-        neuron_nodes = {node for node in self.nodes if node[0] == settings.NEURON}
-        graph = {node: set() for node in neuron_nodes}
-        for edge in self.edges:
-            src, tgt = edge
-            if src in neuron_nodes and tgt in neuron_nodes:
-                graph[src].add(tgt)
-                graph[tgt].add(src)
-        visited = set()
-        clusters = []
-        for node in neuron_nodes:
-            if node not in visited:
-                comp = set()
-                stack = [node]
-                while stack:
-                    n = stack.pop()
-                    if n not in visited:
-                        visited.add(n)
-                        comp.add(n)
-                        stack.extend(graph[n] - visited)
-                for edge in self.edges:
-                    src, tgt = edge
-                    if src in comp and tgt[0] in (settings.SENSOR, settings.ACTION):
-                        comp.add(tgt)
-                    elif tgt in comp and src[0] in (settings.SENSOR, settings.ACTION):
-                        comp.add(src)
-                #Remove neurons that don’t eventually lead to an action.
-                comp = prune_unused_neurons(comp, self.edges)
-                clusters.append(comp)
-        return clusters
+        return compute_clusters(self.nodes, self.edges)
 
     def cluster_has_sensor_and_action(self, cluster):
-        node_types = {node[0] for node in cluster}
-        return settings.SENSOR in node_types and settings.ACTION in node_types
+        return cluster_has_sensor_and_action(cluster)
 
     def draw_cluster(self, cluster, canvas):
         cluster_edges = [edge for edge in self.edges if edge[0] in cluster and edge[1] in cluster]
-        positions, _ = layout_graph(cluster, cluster_edges, self.canvas_width, self.canvas_height)
+        cluster_nodes = [node for node in self.nodes if node in cluster]
+        positions = layout_graph(cluster_nodes, cluster_edges, self.canvas_width, self.canvas_height)
         node_items = {}
         edge_items = {}
         node_to_edges = {node: [] for node in cluster}
@@ -178,114 +138,15 @@ class GraphApp:
         canvas.tag_bind("draggable", "<B1-Motion>", on_node_motion)
         canvas.tag_bind("draggable", "<ButtonRelease-1>", on_node_release)
 
-def layout_graph(nodes, edges, width, height, iterations=50):
-    margin = 50
-    lane_x = {settings.SENSOR: margin, settings.ACTION: width - margin}
-    lanes = {settings.SENSOR: [], settings.NEURON: [], settings.ACTION: []}
-    for node in nodes:
-        lanes[node[0]].append(node)
-    for lane in lanes:
-        lanes[lane].sort(key=lambda n: n[1])
-    order = {}
-    for lane in lanes:
-        for idx, node in enumerate(lanes[lane]):
-            order[node] = idx
-    neighbor_map = {node: [] for node in nodes}
-    for v, u in edges:
-        if v in nodes and u in nodes:
-            neighbor_map[v].append(u)
-            neighbor_map[u].append(v)
-    for _ in range(iterations):
-        for lane in lanes:
-            new_order = []
-            for node in lanes[lane]:
-                neighbor_orders = [order[n] for n in neighbor_map[node] if n[0] != lane]
-                barycenter = sum(neighbor_orders) / len(neighbor_orders) if neighbor_orders else order[node]
-                new_order.append((node, barycenter))
-            new_order.sort(key=lambda tup: tup[1])
-            lanes[lane] = [node for node, _ in new_order]
-            for idx, node in enumerate(lanes[lane]):
-                order[node] = idx
-    positions = {}
-    for lane in (settings.SENSOR, settings.ACTION):
-        lane_nodes = lanes[lane]
-        count = len(lane_nodes)
-        spacing = (height - 2 * margin) / (count - 1) if count > 1 else 0
-        for i, node in enumerate(lane_nodes):
-            x_jitter = random.uniform(-30, 30)
-            y_jitter = random.uniform(-10, 10)
-            x = lane_x[lane] + x_jitter
-            y = margin + i * spacing + y_jitter
-            positions[node] = [x, y]
-    neurons = lanes[settings.NEURON]
-    if neurons:
-        layer = {n: 0 for n in neurons}
-        for edge in edges:
-            src, tgt = edge
-            if tgt in neurons and src[0] == settings.SENSOR:
-                layer[tgt] = max(layer[tgt], 1)
-        changed = True
-        while changed:
-            changed = False
-            for src, tgt in edges:
-                if src in neurons and tgt in neurons:
-                    new_layer = layer[src] + 1
-                    if new_layer > layer[tgt]:
-                        layer[tgt] = new_layer
-                        changed = True
-        layers_group = {}
-        for n in neurons:
-            layers_group.setdefault(layer[n], []).append(n)
-        max_layer = max(layers_group.keys()) if layers_group else 1
-        col_spacing = (width * 0.7) / max_layer
-        for l in layers_group:
-            group = layers_group[l]
-            x = width * 0.15 + l * col_spacing + random.uniform(-20, 20)
-            used_y = set()
-            for node in group:
-                for _ in range(10):
-                    y = random.uniform(margin, height - margin)
-                    if all(abs(y - uy) > 10 for uy in used_y):
-                        used_y.add(y)
-                        break
-                else:
-                    y = random.uniform(margin, height - margin)
-                positions[node] = [x, y]
-    return positions, 0
-
-def prune_unused_neurons(cluster, edges):
-    outgoing = {}
-    for edge in edges:
-        src, tgt = edge
-        if src in cluster and src[0] == settings.NEURON and tgt in cluster and (tgt[0] in (settings.NEURON, settings.ACTION)):
-            outgoing.setdefault(src, []).append(tgt)
-    valid = set()
-    for src, targets in outgoing.items():
-        for t in targets:
-            if t[0] == settings.ACTION:
-                valid.add(src)
-                break
-    changed = True
-    while changed:
-        changed = False
-        for src, targets in outgoing.items():
-            if src in valid:
-                continue
-            for t in targets:
-                if t in valid or (t[0] == settings.ACTION):
-                    valid.add(src)
-                    changed = True
+def read_connections_from_file(filename, generation=None):
+    if filename.endswith(".gz"):
+        genome = []
+        for record in read_generation_log(filename):
+            if generation is None or record["generation"] == generation:
+                genome = record["example_genome"]
+                if generation is not None:
                     break
-    pruned = set()
-    for node in cluster:
-        if node[0] == settings.NEURON:
-            if node in valid:
-                pruned.add(node)
-        else:
-            pruned.add(node)
-    return pruned
-
-def read_connections_from_file(filename):
+        return genome
     with open(filename, 'r') as file:
         for line in file:
             if line.startswith("Example genome for generation"):
@@ -295,7 +156,9 @@ def read_connections_from_file(filename):
     return []
 
 def main():
-    connections_from_file = read_connections_from_file("connections.txt")
+    filename = sys.argv[1] if len(sys.argv) > 1 else settings.log_file
+    generation = int(sys.argv[2]) if len(sys.argv) > 2 else None
+    connections_from_file = read_connections_from_file(filename, generation)
     GraphApp(connections_from_file)
 
 if __name__ == "__main__":
@@ -1,29 +1,57 @@
 import random
+import struct
+import numpy as np
 import settings
 
-def make_random_genome():
+#source_type, source_num, sink_type, sink_num, weight
+GENE_FORMAT = struct.Struct('<BIBId')
+GENE_DTYPE = np.dtype([('source_type', 'u1'), ('source_num', '<u4'), ('sink_type', 'u1'), ('sink_num', '<u4'), ('weight', '<f8')])
+
+def make_random_genome(rng=None):
+    if settings.PACKED_GENOME:
+        return make_random_genomes(1)[0]
+    if rng is None:
+        rng = random
     genome = []
     P_SENSOR = 0.3
     P_NEURON_SINK = 0.7
     for _ in range(settings.GENOME_LENGTH):
-        source_type = random.choices([settings.SENSOR, settings.NEURON], [P_SENSOR, 1 - P_SENSOR])[0]
+        source_type = rng.choices([settings.SENSOR, settings.NEURON], [P_SENSOR, 1 - P_SENSOR])[0]
         if source_type == settings.SENSOR:
             sink_type = settings.NEURON
         else:
-            sink_type = random.choices([settings.NEURON, settings.ACTION], [P_NEURON_SINK, 1 - P_NEURON_SINK])[0]
-        source_num = (random.randint(0, settings.NUM_SENSES - 1) if source_type == settings.SENSOR else random.randint(0, settings.MAX_NEURONS - 1))
-        sink_num = (random.randint(0, settings.MAX_NEURONS - 1) if sink_type == settings.NEURON else random.randint(0, settings.NUM_ACTIONS - 1))
-        weight = random.uniform(-1.0, 1.0)
+            sink_type = rng.choices([settings.NEURON, settings.ACTION], [P_NEURON_SINK, 1 - P_NEURON_SINK])[0]
+        source_num = (rng.randint(0, settings.NUM_SENSES - 1) if source_type == settings.SENSOR else rng.randint(0, settings.MAX_NEURONS - 1))
+        sink_num = (rng.randint(0, settings.MAX_NEURONS - 1) if sink_type == settings.NEURON else rng.randint(0, settings.NUM_ACTIONS - 1))
+        weight = rng.uniform(-1.0, 1.0)
         genome.append([source_type, source_num, sink_type, sink_num, weight])
     return genome
 
-def reproduce_genome(parent_genome):
+def reproduce_genome(parent_genome, delta=None, rng=None):
+    if isinstance(parent_genome, np.ndarray):
+        return reproduce_genomes([parent_genome])[0]
     child_genome = [gene[:] for gene in parent_genome]
-    return mutate_genome(child_genome)
+    return mutate_genome(child_genome, delta, rng)
+
+def serialize_genome(genome):
+    if isinstance(genome, np.ndarray):
+        return genome.tobytes()
+    return b''.join(GENE_FORMAT.pack(*gene) for gene in genome)
 
-def mutate_genome(genome):
+def deserialize_genome(data):
+    if settings.PACKED_GENOME:
+        return np.frombuffer(data, dtype=GENE_DTYPE).copy()
+    return [list(gene) for gene in GENE_FORMAT.iter_unpack(data)]
+
+def mutate_genome(genome, delta=None, rng=None):
+    #When a delta list is given, the applied changes are appended to it as
+    #('edit', index, old_gene, new_gene), ('add', index, gene) and ('remove', index, gene)
+    if isinstance(genome, np.ndarray):
+        return reproduce_genomes([genome])[0]
     #if random.random() > settings.MUTATION_RATE:
     #    return genome
+    if rng is None:
+        rng = random
     genome = list(genome)
     used_neurons = {g[1] for g in genome if g[0] == settings.NEURON}
     used_neurons |= {g[3] for g in genome if g[2] == settings.NEURON}
@@ -37,50 +65,189 @@ def mutate_genome(genome):
     p_add = settings.MUTATION_RATE*0.2
     p_remove = settings.MUTATION_RATE*0.18
     sensor_add = 0.2
-    if genome and random.random() < p_edit:
-        gene = random.choice(genome)
-        field = random.choice(['sourceType', 'sinkType', 'sourceNum', 'sinkNum', 'weight'])
+    if genome and rng.random() < p_edit:
+        index = rng.randrange(len(genome))
+        gene = genome[index]
+        old_gene = gene[:]
+        field = rng.choice(['sourceType', 'sinkType', 'sourceNum', 'sinkNum', 'weight'])
         if field == 'sourceType':
-            gene[0] = random.randint(0, 1)
+            gene[0] = rng.randint(0, 1)
             if gene[0] == settings.SENSOR:
-                gene[1] = random.randint(0, settings.NUM_SENSES - 1)
+                gene[1] = rng.randint(0, settings.NUM_SENSES - 1)
                 gene[2] = settings.NEURON
                 gene[3] = new_neuron_id()
             else:
-                gene[1] = random.choice(list(used_neurons)) if used_neurons else 0
+                gene[1] = rng.choice(list(used_neurons)) if used_neurons else 0
         elif field == 'sinkType':
-            if gene[0] == settings.SENSOR or random.random() < 0.5:
+            if gene[0] == settings.SENSOR or rng.random() < 0.5:
                 gene[2] = settings.NEURON
                 gene[3] = new_neuron_id()
             else:
                 gene[2] = settings.ACTION
-                gene[3] = random.randint(0, settings.NUM_ACTIONS - 1)
+                gene[3] = rng.randint(0, settings.NUM_ACTIONS - 1)
         elif field == 'sourceNum':
-            gene[1] = (random.randint(0, settings.NUM_SENSES - 1)
+            gene[1] = (rng.randint(0, settings.NUM_SENSES - 1)
                        if gene[0] == settings.SENSOR
-                       else random.choice(list(used_neurons)) if used_neurons else 0)
+                       else rng.choice(list(used_neurons)) if used_neurons else 0)
         elif field == 'sinkNum':
             gene[3] = (new_neuron_id()
                        if gene[2] == settings.NEURON
-                       else random.randint(0, settings.NUM_ACTIONS - 1))
+                       else rng.randint(0, settings.NUM_ACTIONS - 1))
         elif field == 'weight':
-            gene[4] = random.uniform(-1.0, 1.0)
-    if random.random() < p_add:
-        if random.random() < sensor_add:
+            gene[4] = rng.uniform(-1.0, 1.0)
+        if delta is not None:
+            delta.append(('edit', index, old_gene, gene[:]))
+    if rng.random() < p_add:
+        if rng.random() < sensor_add:
             new_gene = [settings.SENSOR,
-                        random.randint(0, settings.NUM_SENSES - 1),
+                        rng.randint(0, settings.NUM_SENSES - 1),
                         settings.NEURON,
                         new_neuron_id(),
-                        random.uniform(-1.0, 1.0)]
+                        rng.uniform(-1.0, 1.0)]
         else:
-            source = random.choice(list(used_neurons)) if used_neurons else 0
+            source = rng.choice(list(used_neurons)) if used_neurons else 0
             new_gene = [settings.NEURON,
                         source,
                         settings.ACTION,
-                        random.randint(0, settings.NUM_ACTIONS - 1),
-                        random.uniform(-1.0, 1.0)]
+                        rng.randint(0, settings.NUM_ACTIONS - 1),
+                        rng.uniform(-1.0, 1.0)]
+        if delta is not None:
+            delta.append(('add', len(genome), new_gene[:]))
         genome.append(new_gene)
-    if genome and random.random() < p_remove:
-        genome.pop(random.randint(0, len(genome) - 1))
+    if genome and rng.random() < p_remove:
+        index = rng.randint(0, len(genome) - 1)
+        removed = genome.pop(index)
+        if delta is not None:
+            delta.append(('remove', index, removed))
     return genome
 
+
+def pack_genome(genome):
+    return np.array([tuple(gene) for gene in genome], dtype=GENE_DTYPE)
+
+def unpack_genome(genome):
+    if not isinstance(genome, np.ndarray):
+        return genome
+    return [list(gene) for gene in genome.tolist()]
+
+def concatenate_genomes(genomes):
+    #np.concatenate promotes structured dtypes per array, which is slow for many small genomes
+    return np.frombuffer(b''.join(genome.tobytes() for genome in genomes), dtype=GENE_DTYPE)
+
+def numpy_rng():
+    #Seeded from the random module so random.seed still fixes the whole run
+    return np.random.default_rng(random.getrandbits(64))
+
+def make_random_genomes(count, rng=None):
+    rng = rng or numpy_rng()
+    shape = (count, settings.GENOME_LENGTH)
+    P_SENSOR = 0.3
+    P_NEURON_SINK = 0.7
+    genes = np.empty(shape, dtype=GENE_DTYPE)
+    source_sensor = rng.random(shape) < P_SENSOR
+    sink_neuron = source_sensor | (rng.random(shape) < P_NEURON_SINK)
+    genes['source_type'] = np.where(source_sensor, settings.SENSOR, settings.NEURON)
+    genes['source_num'] = np.where(source_sensor, rng.integers(0, settings.NUM_SENSES, shape), rng.integers(0, settings.MAX_NEURONS, shape))
+    genes['sink_type'] = np.where(sink_neuron, settings.NEURON, settings.ACTION)
+    genes['sink_num'] = np.where(sink_neuron, rng.integers(0, settings.MAX_NEURONS, shape), rng.integers(0, settings.NUM_ACTIONS, shape))
+    genes['weight'] = rng.uniform(-1.0, 1.0, shape)
+    return list(genes)
+
+def reproduce_genomes(parent_genomes, rng=None):
+    #Same mutation probabilities as mutate_genome, applied to every child at once
+    rng = rng or numpy_rng()
+    count = len(parent_genomes)
+    lengths = np.array([len(genome) for genome in parent_genomes])
+    width = int(lengths.max(initial=0)) + 1
+    rows = np.arange(count)
+    genes = np.zeros((count, width), dtype=GENE_DTYPE)
+    valid = np.arange(width) < lengths[:, None]
+    if count:
+        genes[valid] = concatenate_genomes(parent_genomes)
+    source_type = genes['source_type'].astype(np.int64)
+    source_num = genes['source_num'].astype(np.int64)
+    sink_type = genes['sink_type'].astype(np.int64)
+    sink_num = genes['sink_num'].astype(np.int64)
+    weight = genes['weight']
+    #Distinct neuron ids per genome, for choosing an existing neuron and the next free id
+    endpoints = np.concatenate((np.where(valid & (source_type == settings.NEURON), source_num, -1),
+                                np.where(valid & (sink_type == settings.NEURON), sink_num, -1)), axis=1)
+    endpoints.sort(axis=1)
+    distinct = endpoints >= 0
+    distinct[:, 1:] &= endpoints[:, 1:] != endpoints[:, :-1]
+    used_count = distinct.sum(axis=1)
+    rank = np.cumsum(distinct, axis=1)
+    next_id = endpoints[:, -1] + 1
+    def choose_used():
+        pick = (rng.random(count) * used_count).astype(np.int64) + 1
+        position = np.argmax(distinct & (rank == pick[:, None]), axis=1)
+        return np.where(used_count > 0, endpoints[rows, position], 0)
+    p_edit = settings.MUTATION_RATE
+    p_add = settings.MUTATION_RATE*0.2
+    p_remove = settings.MUTATION_RATE*0.18
+    sensor_add = 0.2
+    #Edit one field of one gene
+    edit = (lengths > 0) & (rng.random(count) < p_edit)
+    index = (rng.random(count) * lengths).astype(np.int64)
+    field = rng.integers(0, 5, count)
+    random_sense = rng.integers(0, settings.NUM_SENSES, count)
+    random_action = rng.integers(0, settings.NUM_ACTIONS, count)
+    random_type = rng.integers(0, 2, count)
+    coin = rng.random(count) < 0.5
+    random_weight = rng.uniform(-1.0, 1.0, count)
+    used_choice = choose_used()
+    e = rows[edit]
+    i = index[edit]
+    st, sn, tt, tn, w = source_type[e, i], source_num[e, i], sink_type[e, i], sink_num[e, i], weight[e, i]
+    f = field[edit]
+    takes_id = np.zeros(len(e), dtype=bool)
+    # sourceType
+    m = f == 0
+    to_sensor = m & (random_type[e] == settings.SENSOR)
+    st = np.where(m, random_type[e], st)
+    sn = np.where(to_sensor, random_sense[e], np.where(m, used_choice[e], sn))
+    tt = np.where(to_sensor, settings.NEURON, tt)
+    tn = np.where(to_sensor, next_id[e], tn)
+    takes_id |= to_sensor
+    # sinkType
+    m = f == 1
+    to_neuron = m & ((st == settings.SENSOR) | coin[e])
+    tt = np.where(to_neuron, settings.NEURON, np.where(m, settings.ACTION, tt))
+    tn = np.where(to_neuron, next_id[e], np.where(m, random_action[e], tn))
+    takes_id |= to_neuron
+    # sourceNum
+    m = f == 2
+    sn = np.where(m, np.where(st == settings.SENSOR, random_sense[e], used_choice[e]), sn)
+    # sinkNum
+    m = f == 3
+    new_sink = m & (tt == settings.NEURON)
+    tn = np.where(new_sink, next_id[e], np.where(m, random_action[e], tn))
+    takes_id |= new_sink
+    # weight
+    w = np.where(f == 4, random_weight[e], w)
+    source_type[e, i], source_num[e, i], sink_type[e, i], sink_num[e, i], weight[e, i] = st, sn, tt, tn, w
+    next_id[e] += takes_id
+    #Append one gene
+    add = rng.random(count) < p_add
+    add_sensor = rng.random(count) < sensor_add
+    add_source = choose_used()
+    add_sense = rng.integers(0, settings.NUM_SENSES, count)
+    add_action = rng.integers(0, settings.NUM_ACTIONS, count)
+    add_weight = rng.uniform(-1.0, 1.0, count)
+    a = rows[add]
+    i = lengths[add]
+    s = add_sensor[add]
+    source_type[a, i] = np.where(s, settings.SENSOR, settings.NEURON)
+    source_num[a, i] = np.where(s, add_sense[add], add_source[add])
+    sink_type[a, i] = np.where(s, settings.NEURON, settings.ACTION)
+    sink_num[a, i] = np.where(s, next_id[add], add_action[add])
+    weight[a, i] = add_weight[add]
+    lengths = lengths + add
+    valid = np.arange(width) < lengths[:, None]
+    #Remove one gene
+    remove = (lengths > 0) & (rng.random(count) < p_remove)
+    remove_index = (rng.random(count) * lengths).astype(np.int64)
+    valid[rows[remove], remove_index[remove]] = False
+    lengths = lengths - remove
+    genes['source_type'], genes['source_num'], genes['sink_type'], genes['sink_num'], genes['weight'] = source_type, source_num, sink_type, sink_num, weight
+    return np.split(genes[valid], np.cumsum(lengths)[:-1])
@@ -0,0 +1,78 @@
+import settings
+
+def adjacency(edges):
+    #successors and predecessors of every (source, sink) pair, in edge order
+    successors = {}
+    predecessors = {}
+    for src, tgt in edges:
+        successors.setdefault(src, []).append(tgt)
+        predecessors.setdefault(tgt, []).append(src)
+    return successors, predecessors
+
+def neuron_successors(genome):
+    successors = {}
+    for gene in genome:
+        if gene[0] == settings.NEURON and gene[2] == settings.NEURON:
+            successors.setdefault(gene[1], []).append(gene[3])
+    return successors
+
+def reachable(starts, neighbors, allowed=None):
+    #Worklist search; every node and edge is visited at most once
+    found = set()
+    stack = []
+    for node in starts:
+        if node not in found and (allowed is None or node in allowed):
+            found.add(node)
+            stack.append(node)
+    while stack:
+        for other in neighbors.get(stack.pop(), ()):
+            if other not in found and (allowed is None or other in allowed):
+                found.add(other)
+                stack.append(other)
+    return found
+
+def driven_neurons(genome):
+    #Sinks of genes whose source number differs from the sink number. Closing this set over
+    #neuron-to-neuron genes adds nothing: such a gene either seeds its own sink or is a self-loop
+    return {gene[3] for gene in genome
+            if gene[2] == settings.NEURON and gene[0] in (settings.SENSOR, settings.NEURON) and gene[1] != gene[3]}
+
+def strongly_connected_components(nodes, successors):
+    #Iterative Tarjan; components come out sinks first, the reverse of a topological order
+    index = {}
+    low = {}
+    on_stack = set()
+    stack = []
+    components = []
+    for root in nodes:
+        if root in index:
+            continue
+        index[root] = low[root] = len(index)
+        stack.append(root)
+        on_stack.add(root)
+        work = [(root, iter(successors.get(root, ())))]
+        while work:
+            node, children = work[-1]
+            for child in children:
+                if child not in index:
+                    index[child] = low[child] = len(index)
+                    stack.append(child)
+                    on_stack.add(child)
+                    work.append((child, iter(successors.get(child, ()))))
+                    break
+                if child in on_stack and index[child] < low[node]:
+                    low[node] = index[child]
+            else:
+                work.pop()
+                if work and low[node] < low[work[-1][0]]:
+                    low[work[-1][0]] = low[node]
+                if low[node] == index[node]:
+                    component = []
+                    while True:
+                        member = stack.pop()
+                        on_stack.discard(member)
+                        component.append(member)
+                        if member == node:
+                            break
+                    components.append(component)
+    return components
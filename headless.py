@@ -0,0 +1,128 @@
+import argparse
+import random
+import time
+from collections import Counter
+import settings
+from simulation import Simulation
+from checkpoint import load_checkpoint, maybe_checkpoint, checkpoint_population
+from brain import brain_cache
+from instrumentation import profiler
+from sensors import get_sensor_inputs, get_store_sensor_inputs
+
+def evolve(sim, generations):
+    sensor_callback = lambda ind: get_sensor_inputs(ind, sim.population, sim.current_step, ind.brain.sensor_usage)
+    store_sensor_callback = lambda store: get_store_sensor_inputs(store, sim.current_step)
+    survival_rates = []
+    target = sim.generation + generations
+    while sim.generation < target:
+        generation = sim.generation
+        sim.update(settings.GENERATION_STEPS, sensor_callback=sensor_callback, store_sensor_callback=store_sensor_callback)
+        if sim.generation != generation:
+            survival_rates.append(sim.survival_rate)
+            maybe_checkpoint(sim)
+    return survival_rates
+
+def compare_modes(generations, seeds):
+    #Same seeds under both evaluation modes: per-seed mean and final survival, and wall time per mode
+    saved = settings.snapshot()
+    settings.disable_outputs()
+    results = {}
+    try:
+        for mode in ('synchronous', 'topological'):
+            settings.EVALUATION_MODE = mode
+            result = results[mode] = {"mean": [], "final": [], "acyclic": [], "seconds": 0.0}
+            for seed in seeds:
+                random.seed(seed)
+                brain_cache.clear()
+                sim = Simulation()
+                start = time.perf_counter()
+                survival_rates = evolve(sim, generations)
+                result["seconds"] += time.perf_counter() - start
+                sim.close()
+                result["mean"].append(sum(survival_rates) / len(survival_rates))
+                result["final"].append(survival_rates[-1])
+                result["acyclic"].append(sum(ind.brain.wiring.order is not None for ind in sim.population) / len(sim.population))
+    finally:
+        settings.apply(saved)
+    return results
+
+def print_comparison(results, generations):
+    print(f"{'mode':12s} {'mean survival':>14s} {'final':>8s} {'acyclic':>8s} {'gen/sec':>8s}")
+    for mode, result in results.items():
+        runs = len(result["mean"])
+        print(f"{mode:12s} {sum(result['mean']) / runs * 100:13.1f}% {sum(result['final']) / runs * 100:7.1f}% "
+              f"{sum(result['acyclic']) / runs * 100:7.0f}% {generations * runs / result['seconds']:8.2f}")
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Run generations without a display")
+    parser.add_argument("--generations", type=int, default=10)
+    parser.add_argument("--population", type=int, default=None,
+                        help=f"individuals per generation, default {settings.POPULATION_SIZE} or the checkpoint's on --resume")
+    parser.add_argument("--steps", type=int, default=settings.GENERATION_STEPS)
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--batch", action="store_true", help="use the batched brain engine")
+    parser.add_argument("--compile", action="store_true", help="run brains through generated code")
+    parser.add_argument("--mode", choices=("synchronous", "topological"), default=settings.EVALUATION_MODE,
+                        help="brain evaluation: two synchronous sweeps, or one ordered pass for acyclic brains")
+    parser.add_argument("--ab", type=int, metavar="SEEDS", default=0,
+                        help="compare both evaluation modes over this many seeds, starting at --seed")
+    parser.add_argument("--step-workers", type=int, default=settings.STEP_WORKERS,
+                        help="split every step of the population across this many processes")
+    parser.add_argument("--early-termination", action="store_true", help="end a generation once the population stops changing")
+    parser.add_argument("--checkpoint-interval", type=int, default=settings.CHECKPOINT_INTERVAL)
+    parser.add_argument("--resume", action="store_true", help=f"continue from {settings.checkpoint_file}")
+    parser.add_argument("--profile", action="store_true", help="time each phase of every generation")
+    parser.add_argument("--quiet", action="store_true", help="skip the per-generation line")
+    args = parser.parse_args()
+    if args.generations < 1:
+        parser.error("--generations must be at least 1")
+    if args.resume and args.population is not None:
+        saved = checkpoint_population(settings.checkpoint_file)
+        if args.population != saved:
+            parser.error(f"--population {args.population} does not match the {saved} individuals in {settings.checkpoint_file}")
+    return args
+
+def main():
+    args = parse_args()
+    if args.population is not None:
+        settings.POPULATION_SIZE = args.population
+    settings.GENERATION_STEPS = args.steps
+    settings.BATCH_BRAIN = settings.BATCH_BRAIN or args.batch
+    settings.COMPILE_BRAINS = settings.COMPILE_BRAINS or args.compile
+    settings.EARLY_TERMINATION = settings.EARLY_TERMINATION or args.early_termination
+    settings.EVALUATION_MODE = args.mode
+    settings.STEP_WORKERS = args.step_workers
+    settings.PRINT_GENERATION = not args.quiet
+    settings.CHECKPOINT_INTERVAL = args.checkpoint_interval
+    profiler.enabled = profiler.enabled or args.profile
+    if args.ab:
+        first = args.seed if args.seed is not None else 0
+        print_comparison(compare_modes(args.generations, range(first, first + args.ab)), args.generations)
+        return
+    if args.seed is not None:
+        random.seed(args.seed)
+    if args.resume:
+        sim = load_checkpoint(settings.checkpoint_file)
+    else:
+        if settings.WRITE_GENOME:
+            with open(settings.log_file, "w"):
+                pass
+        sim = Simulation()
+    start = time.perf_counter()
+    survival_rates = evolve(sim, args.generations)
+    elapsed = time.perf_counter() - start
+    sim.close()
+    steps = args.generations * args.steps
+    mean_survival = sum(survival_rates) / len(survival_rates) if survival_rates else 0
+    print(f"{args.generations} generations, {steps} steps in {elapsed:.2f}s")
+    print(f"{steps / elapsed:.1f} steps/sec, {args.generations / elapsed:.2f} generations/sec")
+    if settings.EARLY_TERMINATION:
+        print(f"Skipped {sim.total_skipped_steps} of {steps} steps at steady state")
+    cache = brain_cache.stats()
+    print(f"Brain cache {cache['hits']} hits, {cache['misses']} misses ({cache['hit_rate']*100:.1f}%)")
+    kinds = Counter(ind.brain.wiring.kind for ind in sim.population)
+    print("Final brains " + ", ".join(f"{count} {kind}" for kind, count in sorted(kinds.items())))
+    print(f"Mean survival {mean_survival*100:.1f}%, final {sim.survival_rate*100:.0f}%")
+
+if __name__ == "__main__":
+    main()
@@ -1,20 +1,69 @@
 import random
+import numpy as np
 import settings
 from genome import make_random_genome
 from brain import Brain
+from population_store import PopulationStore
 
 class Individual:
-    def __init__(self, genome=None, x=0, y=0):
-        self.genome = list(genome) if genome is not None else make_random_genome()
-        self.brain = Brain(self.genome)
+    #A view onto one slot of a PopulationStore
+    __slots__ = ('genome', 'brain', 'store', 'index')
+
+    def __init__(self, genome=None, x=0, y=0, brain=None, store=None, index=0):
+        if genome is None:
+            genome = make_random_genome()
+        self.genome = genome if isinstance(genome, np.ndarray) else list(genome)
+        self.brain = brain if brain is not None else Brain(self.genome)
+        #Only a standalone individual gets a store of its own; populations pass theirs
+        self.store = store if store is not None else PopulationStore(1)
+        self.index = index
         self.x = x
         self.y = y
         self.last_dx = 0
         self.last_dy = 0
 
+    @property
+    def x(self):
+        return int(self.store.x[self.index])
+
+    @x.setter
+    def x(self, value):
+        self.store.x[self.index] = value
+
+    @property
+    def y(self):
+        return int(self.store.y[self.index])
+
+    @y.setter
+    def y(self, value):
+        self.store.y[self.index] = value
+
+    @property
+    def last_dx(self):
+        return int(self.store.last_dx[self.index])
+
+    @last_dx.setter
+    def last_dx(self, value):
+        self.store.last_dx[self.index] = value
+
+    @property
+    def last_dy(self):
+        return int(self.store.last_dy[self.index])
+
+    @last_dy.setter
+    def last_dy(self, value):
+        self.store.last_dy[self.index] = value
+
+    @property
+    def id(self):
+        return int(self.store.ids[self.index])
+
+    @id.setter
+    def id(self, value):
+        self.store.ids[self.index] = value
+
     def update(self, sensor_inputs):
-        return self.brain.activate(sensor_inputs)
+        return self.brain.evaluate(sensor_inputs)
 
     def __repr__(self):
         return f"<Individual pos=({int(self.x)},{int(self.y)})>"
-
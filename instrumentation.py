@@ -0,0 +1,41 @@
+from collections import deque
+import settings
+
+class Profiler:
+    #Per-phase nanosecond totals and counters, summarised once per generation
+    def __init__(self, history=256):
+        self.enabled = settings.PROFILE
+        self.history = deque(maxlen=history)
+        self.sink = None
+        self.reset()
+
+    def reset(self):
+        self.phase_ns = {}
+        self.counters = {}
+
+    def add(self, phase, ns):
+        self.phase_ns[phase] = self.phase_ns.get(phase, 0) + ns
+
+    def count(self, name, amount=1):
+        self.counters[name] = self.counters.get(name, 0) + amount
+
+    def end_generation(self, generation, survivors, survival_rate):
+        summary = {"generation": generation, "survivors": survivors, "survival_rate": survival_rate,
+                   "phase_ns": self.phase_ns, "counters": self.counters}
+        self.history.append(summary)
+        if self.sink:
+            self.sink(summary)
+        self.reset()
+        return summary
+
+def format_summary(summary):
+    line = f"Generation {summary['generation']} survivors: {summary['survivors']}, {summary['survival_rate']*100:.0f}%"
+    if summary["phase_ns"]:
+        line += " | " + " ".join(f"{phase} {ns / 1e6:.1f}ms" for phase, ns in summary["phase_ns"].items())
+    if summary.get("skipped_steps"):
+        line += f" | skipped {summary['skipped_steps']} steps"
+    if summary["counters"]:
+        line += " | " + " ".join(f"{name} {value}" for name, value in summary["counters"].items())
+    return line
+
+profiler = Profiler()
@@ -0,0 +1,100 @@
+import argparse
+import random
+import multiprocessing as mp
+import settings
+from simulation import Simulation
+from genome import serialize_genome, deserialize_genome
+from headless import evolve
+
+def island_worker(seed, overrides, conn):
+    settings.apply(overrides)
+    settings.disable_outputs()
+    random.seed(seed)
+    sim = Simulation()
+    while True:
+        message = conn.recv()
+        if message is None:
+            break
+        generations, immigrants, migrants = message
+        sim.replace_individuals([deserialize_genome(data) for data in immigrants])
+        survival_rates = evolve(sim, generations)
+        pool = sim.survivors or sim.population
+        chosen = random.sample(pool, min(migrants, len(pool)))
+        conn.send((survival_rates, [serialize_genome(ind.genome) for ind in chosen]))
+    conn.close()
+
+def migration_targets(count, topology, rng):
+    if topology == 'ring':
+        return [(i + 1) % count for i in range(count)]
+    return [rng.choice([j for j in range(count) if j != i]) if count > 1 else i for i in range(count)]
+
+def run_islands(islands, generations, interval, migrants, topology='ring', seed=0, overrides=None):
+    overrides = overrides or {}
+    rng = random.Random(seed)
+    connections, workers = [], []
+    for i in range(islands):
+        parent_conn, child_conn = mp.Pipe()
+        worker = mp.Process(target=island_worker, args=(seed * 1000 + i, overrides, child_conn))
+        worker.start()
+        connections.append(parent_conn)
+        workers.append(worker)
+    histories = [[] for _ in range(islands)]
+    immigrants = [[] for _ in range(islands)]
+    done = 0
+    try:
+        while done < generations:
+            epoch = min(interval, generations - done)
+            for conn, arriving in zip(connections, immigrants):
+                conn.send((epoch, arriving, migrants))
+            emigrants = []
+            for i, conn in enumerate(connections):
+                survival_rates, genomes = conn.recv()
+                histories[i].extend(survival_rates)
+                emigrants.append(genomes)
+            immigrants = [[] for _ in range(islands)]
+            for source, target in enumerate(migration_targets(islands, topology, rng)):
+                immigrants[target].extend(emigrants[source])
+            done += epoch
+    finally:
+        for conn in connections:
+            conn.send(None)
+        for worker in workers:
+            worker.join()
+    return merge_histories(histories)
+
+def merge_histories(histories):
+    report = []
+    for generation, rates in enumerate(zip(*histories)):
+        report.append({
+            "generation": generation,
+            "mean": sum(rates) / len(rates),
+            "min": min(rates),
+            "max": max(rates),
+            "islands": list(rates)})
+    return report
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Evolve several populations in parallel with migration")
+    parser.add_argument("--islands", type=int, default=mp.cpu_count())
+    parser.add_argument("--generations", type=int, default=50)
+    parser.add_argument("--interval", type=int, default=5, help="generations between migrations")
+    parser.add_argument("--migrants", type=int, default=2, help="survivor genomes sent per island")
+    parser.add_argument("--topology", choices=("ring", "random"), default="ring")
+    parser.add_argument("--population", type=int, default=settings.POPULATION_SIZE)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--batch", action="store_true", help="use the batched brain engine")
+    args = parser.parse_args()
+    if args.generations < 1:
+        parser.error("--generations must be at least 1")
+    return args
+
+def main():
+    args = parse_args()
+    overrides = {"POPULATION_SIZE": args.population, "BATCH_BRAIN": settings.BATCH_BRAIN or args.batch}
+    report = run_islands(args.islands, args.generations, args.interval, args.migrants, args.topology, args.seed, overrides)
+    for row in report:
+        rates = " ".join(f"{rate*100:3.0f}" for rate in row["islands"])
+        print(f"Generation {row['generation']} survival mean {row['mean']*100:.0f}% min {row['min']*100:.0f}% max {row['max']*100:.0f}% | {rates}")
+
+if __name__ == "__main__":
+    main()
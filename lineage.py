@@ -0,0 +1,248 @@
+import argparse
+import atexit
+import os
+import struct
+import settings
+from genome import GENE_FORMAT, serialize_genome
+from genome_graph import reachable, neuron_successors
+
+MAGIC = b'LINEAGE1'
+#kind, id, parent id (-1 for roots), generation, op count, gene count (keyframes only)
+RECORD = struct.Struct('<BqqIHI')
+#op code, gene index; edits and adds are followed by the new gene
+OP = struct.Struct('<BI')
+#Snapshots are keyframes of children recorded without a delta, whose changes are unknown
+DELTA, KEYFRAME, SNAPSHOT = 0, 1, 2
+EDIT, ADD, REMOVE, WEIGHT = 0, 1, 2, 3
+OP_CODES = {'edit': EDIT, 'add': ADD, 'remove': REMOVE}
+OP_NAMES = {EDIT: 'edit', ADD: 'add', REMOVE: 'remove', WEIGHT: 'weight'}
+
+class LineageStore:
+    #Append-only record of every individual: parent id plus mutation delta, with a full genome every few generations
+    def __init__(self, path, keyframe_interval=None):
+        self.path = path
+        self.keyframe_interval = keyframe_interval or settings.LINEAGE_KEYFRAME_INTERVAL
+        #Ids continue after the records already in the file, and a record torn by a crash is cut off before appending
+        self.next_id = 0
+        if os.path.exists(path) and os.path.getsize(path):
+            reader = LineageReader(path)
+            self.next_id = max(reader.entries, default=-1) + 1
+            if reader.end < os.path.getsize(path):
+                os.truncate(path, reader.end)
+        self.file = open(path, "ab")
+        if self.file.tell() == 0:
+            self.file.write(MAGIC)
+        self.generation = None
+        #Generations since the last keyframe, for the current and the previous generation's ids
+        self.depth = {}
+        self.parent_depth = {}
+        self.closed = False
+        atexit.register(self.close)
+
+    def record(self, id, parent_id, generation, genome, delta=None):
+        if generation != self.generation:
+            self.generation = generation
+            self.parent_depth, self.depth = self.depth, {}
+        depth = self.parent_depth.get(parent_id, self.keyframe_interval) + 1 if parent_id >= 0 else 0
+        ops = delta or []
+        keyframe = parent_id < 0 or delta is None or depth >= self.keyframe_interval
+        if keyframe:
+            depth = 0
+        self.depth[id] = depth
+        kind = DELTA if not keyframe else SNAPSHOT if parent_id >= 0 and delta is None else KEYFRAME
+        parts = [RECORD.pack(kind, id, parent_id, generation, len(ops), len(genome) if keyframe else 0)]
+        for op in ops:
+            code = OP_CODES[op[0]]
+            if code == EDIT and op[2][:4] == op[3][:4]:
+                code = WEIGHT
+            parts.append(OP.pack(code, op[1]))
+            if code != REMOVE:
+                parts.append(GENE_FORMAT.pack(*op[-1]))
+        if keyframe:
+            parts.append(serialize_genome(genome))
+        self.file.write(b''.join(parts))
+
+    def flush(self):
+        self.file.flush()
+
+    def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        self.file.close()
+
+class LineageReader:
+    def __init__(self, path):
+        with open(path, "rb") as f:
+            self.data = f.read()
+        if self.data[:len(MAGIC)] != MAGIC:
+            raise ValueError(f"{path} is not a lineage file")
+        #id -> (offset of the record, parent id, generation, kind)
+        self.entries = {}
+        offset = len(MAGIC)
+        size = len(self.data)
+        while offset + RECORD.size <= size:
+            kind, id, parent_id, generation, op_count, gene_count = RECORD.unpack_from(self.data, offset)
+            stop = offset + RECORD.size
+            for _ in range(op_count):
+                if stop + OP.size > size:
+                    stop = size + 1
+                    break
+                code, _ = OP.unpack_from(self.data, stop)
+                stop += OP.size + (GENE_FORMAT.size if code != REMOVE else 0)
+            stop += gene_count * GENE_FORMAT.size
+            if stop > size:
+                break
+            self.entries[id] = (offset, parent_id, generation, kind)
+            offset = stop
+        #End of the last complete record; a crash mid-write can leave a partial one after it
+        self.end = offset
+
+    def __len__(self):
+        return len(self.entries)
+
+    def parent(self, id):
+        return self.entries[id][1]
+
+    def generation(self, id):
+        return self.entries[id][2]
+
+    def ops(self, id):
+        #[(op name, index, gene or None)] in the order mutate_genome applied them
+        offset, _, _, _ = self.entries[id]
+        _, _, _, _, op_count, _ = RECORD.unpack_from(self.data, offset)
+        offset += RECORD.size
+        ops = []
+        for _ in range(op_count):
+            code, index = OP.unpack_from(self.data, offset)
+            offset += OP.size
+            gene = None
+            if code != REMOVE:
+                gene = list(GENE_FORMAT.unpack_from(self.data, offset))
+                offset += GENE_FORMAT.size
+            ops.append((OP_NAMES[code], index, gene))
+        return ops
+
+    def keyframe(self, id):
+        offset, _, _, kind = self.entries[id]
+        if kind == DELTA:
+            return None
+        _, _, _, _, op_count, gene_count = RECORD.unpack_from(self.data, offset)
+        offset += RECORD.size
+        for _ in range(op_count):
+            code, _ = OP.unpack_from(self.data, offset)
+            offset += OP.size + (GENE_FORMAT.size if code != REMOVE else 0)
+        return [list(gene) for gene in GENE_FORMAT.iter_unpack(self.data[offset:offset + gene_count * GENE_FORMAT.size])]
+
+    def lineage(self, id):
+        #id, parent, grandparent, ... back to a root
+        chain = []
+        while id >= 0:
+            chain.append(id)
+            id = self.entries[id][1]
+        return chain
+
+    def genome(self, id):
+        #Replays deltas forward from the nearest keyframed ancestor
+        chain = []
+        genome = self.keyframe(id)
+        while genome is None:
+            chain.append(id)
+            id = self.entries[id][1]
+            genome = self.keyframe(id)
+        for descendant in reversed(chain):
+            apply_ops(genome, self.ops(descendant))
+        return genome
+
+    def genomes_along(self, id):
+        #(id, genome) from the oldest recorded ancestor down to id
+        chain = self.lineage(id)[::-1]
+        genome = self.genome(chain[0])
+        yield chain[0], [gene[:] for gene in genome]
+        for descendant in chain[1:]:
+            keyframe = self.keyframe(descendant)
+            genome = keyframe if keyframe is not None else apply_ops(genome, self.ops(descendant))
+            yield descendant, [gene[:] for gene in genome]
+
+    def gene_origin(self, id, index, ignore_weight=False):
+        #(ancestor id, generation, op) where the gene now at index last changed, or was created;
+        #op is 'unknown' when the line passes through a child recorded without its delta
+        while True:
+            if self.entries[id][3] == SNAPSHOT:
+                return id, self.generation(id), 'unknown'
+            for name, i, _ in reversed(self.ops(id)):
+                if i == index and (name in ('edit', 'add') or (name == 'weight' and not ignore_weight)):
+                    return id, self.generation(id), name
+                if name == 'add' and i < index:
+                    index -= 1
+                elif name == 'remove' and i <= index:
+                    index += 1
+            parent_id = self.entries[id][1]
+            if parent_id < 0:
+                return id, self.generation(id), 'root'
+            id = parent_id
+
+    def first_appearance(self, id, predicate):
+        #Earliest ancestor from which predicate(genome) holds without a break down to id, or None
+        found = None
+        for ancestor, genome in self.genomes_along(id):
+            if predicate(genome):
+                if found is None:
+                    found = ancestor
+            else:
+                found = None
+        return found
+
+def apply_ops(genome, ops):
+    for name, index, gene in ops:
+        if name in ('edit', 'weight'):
+            genome[index] = gene
+        elif name == 'add':
+            genome.insert(index, gene)
+        else:
+            genome.pop(index)
+    return genome
+
+def has_pathway(genome, sense, action):
+    #Whether sensor sense reaches action directly or through any chain of neurons
+    if any(g[0] == settings.SENSOR and g[1] == sense and g[2] == settings.ACTION and g[3] == action for g in genome):
+        return True
+    starts = [g[3] for g in genome if g[0] == settings.SENSOR and g[1] == sense and g[2] == settings.NEURON]
+    reached = reachable(starts, neuron_successors(genome))
+    return any(g[0] == settings.NEURON and g[1] in reached and g[2] == settings.ACTION and g[3] == action for g in genome)
+
+def main():
+    parser = argparse.ArgumentParser(description="Query a lineage file")
+    parser.add_argument("file", nargs="?", default=settings.lineage_file)
+    parser.add_argument("--genome", type=int, metavar="ID", help="reconstruct the genome of an individual")
+    parser.add_argument("--lineage", type=int, metavar="ID", help="list the ancestors of an individual")
+    parser.add_argument("--origin", type=int, nargs=2, metavar=("ID", "INDEX"), help="where the gene at INDEX of ID last changed")
+    parser.add_argument("--ignore-weight", action="store_true", help="with --origin, skip weight-only edits")
+    parser.add_argument("--pathway", type=int, nargs=3, metavar=("ID", "SENSE", "ACTION"),
+                        help="ancestor from which SENSE has reached ACTION without a break")
+    args = parser.parse_args()
+    reader = LineageReader(args.file)
+    if args.genome is not None:
+        for gene in reader.genome(args.genome):
+            print(gene)
+    if args.lineage is not None:
+        for ancestor in reader.lineage(args.lineage):
+            print(f"{ancestor}\tgeneration {reader.generation(ancestor)}\t{len(reader.ops(ancestor))} ops")
+    if args.origin:
+        ancestor, generation, name = reader.gene_origin(*args.origin, ignore_weight=args.ignore_weight)
+        print(f"Gene {args.origin[1]} of {args.origin[0]}: {name} in {ancestor}, generation {generation}")
+    if args.pathway:
+        id, sense, action = args.pathway
+        ancestor = reader.first_appearance(id, lambda genome: has_pathway(genome, sense, action))
+        if ancestor is None:
+            print(f"Sensor {sense} does not reach action {action} in {id}")
+        else:
+            print(f"Sensor {sense} reaches action {action} since {ancestor}, generation {reader.generation(ancestor)}")
+    if not (args.genome is not None or args.lineage is not None or args.origin or args.pathway):
+        generations = [entry[2] for entry in reader.entries.values()]
+        keyframes = sum(entry[3] != DELTA for entry in reader.entries.values())
+        print(f"{len(reader)} individuals, generations {min(generations, default=0)}-{max(generations, default=0)}, "
+              f"{keyframes} keyframes, {len(reader.data)} bytes")
+
+if __name__ == "__main__":
+    main()
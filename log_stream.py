@@ -0,0 +1,122 @@
+import atexit
+import gzip
+import json
+import os
+import queue
+import threading
+import zlib
+import settings
+from genome import unpack_genome
+
+class GenerationLog:
+    #Appends one JSON line per generation from a background thread. Each batch is written as a complete gzip member,
+    #so a crash loses at most the batch being written and the file stays readable and appendable
+    def __init__(self, path, max_queue=None):
+        self.path = path
+        self.queue = queue.Queue(maxsize=max_queue or settings.LOG_QUEUE_SIZE)
+        self.dropped = 0
+        self.error = None
+        self.closed = False
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+        atexit.register(self.close)
+
+    def write(self, record):
+        #Never blocks the simulation; records are dropped if the writer falls behind
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+    def run(self):
+        try:
+            while True:
+                lines = []
+                record = self.queue.get()
+                while record is not None:
+                    lines.append(self.encode(record))
+                    if self.queue.empty():
+                        break
+                    record = self.queue.get()
+                if lines:
+                    with open(self.path, "ab") as f:
+                        f.write(gzip.compress("".join(lines).encode("utf-8")))
+                if record is None:
+                    break
+        except Exception as error:
+            self.error = error
+
+    def encode(self, record):
+        record["example_genome"] = unpack_genome(record["example_genome"])
+        if "survivor_genomes" in record:
+            record["survivor_genomes"] = [unpack_genome(genome) for genome in record["survivor_genomes"]]
+        return json.dumps(record) + "\n"
+
+    def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        #A writer that has died no longer empties the queue, so only a live one is asked to stop
+        while self.thread.is_alive():
+            try:
+                self.queue.put(None, timeout=0.1)
+                break
+            except queue.Full:
+                pass
+        self.thread.join()
+        if self.dropped:
+            print(f"Generation log dropped {self.dropped} records because the writer fell behind; {self.path} has gaps")
+        if self.error is not None:
+            raise self.error
+
+def read_members(data):
+    #Text of each complete gzip member; a member cut short by a crash ends the stream
+    offset = 0
+    while offset < len(data):
+        decompressor = zlib.decompressobj(zlib.MAX_WBITS | 16)
+        try:
+            text = decompressor.decompress(data[offset:])
+        except zlib.error:
+            return
+        if not decompressor.eof:
+            return
+        offset = len(data) - len(decompressor.unused_data)
+        yield text.decode("utf-8")
+
+def trim_generation_log(path, generation):
+    #Before resuming at generation: drop a torn tail and the records an abandoned run wrote from generation on
+    if not os.path.exists(path):
+        return
+    with open(path, "rb") as f:
+        data = f.read()
+    lines = [line for text in read_members(data) for line in text.splitlines()
+             if line.strip() and json.loads(line)["generation"] < generation]
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        if lines:
+            f.write(gzip.compress(("\n".join(lines) + "\n").encode("utf-8")))
+    os.replace(tmp_path, path)
+
+def generation_record(generation, survival_rate, population, survivors):
+    lengths = [len(ind.genome) for ind in population]
+    neurons = [ind.brain.num_neurons for ind in population]
+    example = survivors[0] if survivors else population[0]
+    record = {
+        "generation": generation,
+        "survival_rate": survival_rate,
+        "survivors": len(survivors),
+        "population": len(population),
+        "genome_length": {"min": min(lengths), "mean": sum(lengths) / len(lengths), "max": max(lengths)},
+        "neurons": {"min": min(neurons), "mean": sum(neurons) / len(neurons), "max": max(neurons)},
+        "example_genome": example.genome}
+    if settings.LOG_SURVIVOR_GENOMES:
+        record["survivor_genomes"] = [ind.genome for ind in survivors]
+    return record
+
+def read_generation_log(path):
+    with open(path, "rb") as f:
+        data = f.read()
+    for text in read_members(data):
+        for line in text.splitlines():
+            if line.strip():
+                yield json.loads(line)
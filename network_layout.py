@@ -0,0 +1,249 @@
+import argparse
+import json
+import math
+import os
+import random
+import settings
+from log_stream import read_generation_log
+from genome_graph import adjacency, reachable, strongly_connected_components
+
+TYPE_COLORS = {settings.SENSOR: "#fdd835", settings.NEURON: "#64b5f6", settings.ACTION: "#ef5350"}
+NODE_RADIUS = 14
+
+def build_graph(conn_list):
+    #Nodes and edges in first-seen order; a repeated connection keeps its last weight
+    nodes = {}
+    edges = {}
+    for s_type, s_id, t_type, t_id, weight in conn_list:
+        src = (s_type, s_id)
+        tgt = (t_type, t_id)
+        nodes[src] = None
+        nodes[tgt] = None
+        edges[(src, tgt)] = weight
+    return list(nodes), list(edges), edges
+
+def compute_clusters(nodes, edges):
+    #One cluster per connected group of neurons, with the sensors and actions attached to it
+    successors, predecessors = adjacency(edges)
+    label = {}
+    clusters = []
+    for node in nodes:
+        if node[0] != settings.NEURON or node in label:
+            continue
+        label[node] = len(clusters)
+        comp = {node}
+        stack = [node]
+        while stack:
+            n = stack.pop()
+            for other in successors.get(n, []) + predecessors.get(n, []):
+                if other[0] == settings.NEURON:
+                    if other not in label:
+                        label[other] = len(clusters)
+                        stack.append(other)
+                    comp.add(other)
+                else:
+                    comp.add(other)
+        clusters.append(prune_unused_neurons(comp, edges, predecessors))
+    return clusters
+
+def cluster_has_sensor_and_action(cluster):
+    node_types = {node[0] for node in cluster}
+    return settings.SENSOR in node_types and settings.ACTION in node_types
+
+def prune_unused_neurons(cluster, edges, predecessors=None):
+    #Keeps the neurons from which an action in the cluster is reachable, by walking back from the actions
+    if predecessors is None:
+        _, predecessors = adjacency(edges)
+    neurons = {node for node in cluster if node[0] == settings.NEURON}
+    starts = [src for node in cluster if node[0] == settings.ACTION for src in predecessors.get(node, ())]
+    valid = reachable(starts, predecessors, neurons)
+    return {node for node in cluster if node[0] != settings.NEURON or node in valid}
+
+def assign_layers(neurons, edges):
+    #Longest path from the sensors over the condensation of the neuron graph; a cycle shares one layer
+    neuron_set = set(neurons)
+    successors = {n: [] for n in neurons}
+    layer = {n: 0 for n in neurons}
+    for src, tgt in edges:
+        if tgt in neuron_set:
+            if src[0] == settings.SENSOR:
+                layer[tgt] = 1
+            elif src in neuron_set:
+                successors[src].append(tgt)
+    components = strongly_connected_components(neurons, successors)
+    component_of = {node: i for i, component in enumerate(components) for node in component}
+    for i in reversed(range(len(components))):
+        depth = max(layer[node] for node in components[i])
+        for node in components[i]:
+            layer[node] = depth
+        for node in components[i]:
+            for child in successors[node]:
+                if component_of[child] != i and depth + 1 > layer[child]:
+                    layer[child] = depth + 1
+    return layer
+
+def layout_graph(nodes, edges, width, height, iterations=50, rng=None):
+    rng = rng or random.Random(0)
+    margin = 50
+    lane_x = {settings.SENSOR: margin, settings.ACTION: width - margin}
+    lanes = {settings.SENSOR: [], settings.NEURON: [], settings.ACTION: []}
+    for node in nodes:
+        lanes[node[0]].append(node)
+    for lane in lanes:
+        lanes[lane].sort(key=lambda n: n[1])
+    order = {}
+    for lane in lanes:
+        for idx, node in enumerate(lanes[lane]):
+            order[node] = idx
+    #Neighbors in other lanes, built once for all sweeps
+    node_set = set(nodes)
+    cross = {node: [] for node in nodes}
+    for v, u in edges:
+        if v in node_set and u in node_set:
+            if u[0] != v[0]:
+                cross[v].append(u)
+                cross[u].append(v)
+    for _ in range(iterations):
+        changed = False
+        for lane in lanes:
+            barycenter = {}
+            for node in lanes[lane]:
+                neighbors = cross[node]
+                barycenter[node] = sum(order[n] for n in neighbors) / len(neighbors) if neighbors else order[node]
+            new_lane = sorted(lanes[lane], key=barycenter.__getitem__)
+            if new_lane != lanes[lane]:
+                changed = True
+                lanes[lane] = new_lane
+                for idx, node in enumerate(new_lane):
+                    order[node] = idx
+        #An unchanged sweep would repeat itself, so the ordering has converged
+        if not changed:
+            break
+    positions = {}
+    for lane in (settings.SENSOR, settings.ACTION):
+        lane_nodes = lanes[lane]
+        count = len(lane_nodes)
+        spacing = (height - 2 * margin) / (count - 1) if count > 1 else 0
+        for i, node in enumerate(lane_nodes):
+            x = lane_x[lane] + rng.uniform(-30, 30)
+            y = margin + i * spacing + rng.uniform(-10, 10)
+            positions[node] = [x, y]
+    neurons = lanes[settings.NEURON]
+    if neurons:
+        layer = assign_layers(neurons, edges)
+        layers_group = {}
+        for n in neurons:
+            layers_group.setdefault(layer[n], []).append(n)
+        max_layer = max(max(layers_group), 1)
+        col_spacing = (width * 0.7) / max_layer
+        for l, group in layers_group.items():
+            x = width * 0.15 + l * col_spacing + rng.uniform(-20, 20)
+            #Evenly spaced in barycenter order
+            spacing = (height - 2 * margin) / (len(group) + 1)
+            for i, node in enumerate(group):
+                positions[node] = [x, margin + (i + 1) * spacing]
+    return positions
+
+def layout_genome(conn_list, width=1200, height=1000, rng=None):
+    #[(cluster, cluster edges, positions)] for every cluster with both a sensor and an action
+    nodes, edges, _ = build_graph(conn_list)
+    layouts = []
+    for cluster in compute_clusters(nodes, edges):
+        if cluster_has_sensor_and_action(cluster):
+            cluster_edges = [edge for edge in edges if edge[0] in cluster and edge[1] in cluster]
+            cluster_nodes = [node for node in nodes if node in cluster]
+            layouts.append((cluster_nodes, cluster_edges, layout_graph(cluster_nodes, cluster_edges, width, height, rng=rng)))
+    return layouts
+
+def edge_endpoints(p1, p2, radius=NODE_RADIUS):
+    (x1, y1), (x2, y2) = p1, p2
+    dx, dy = x2 - x1, y2 - y1
+    dist = math.hypot(dx, dy)
+    if dist == 0:
+        return None
+    ux, uy = dx/dist, dy/dist
+    return x1 + ux * radius, y1 + uy * radius, x2 - ux * radius, y2 - uy * radius
+
+def render_svg(layouts, weights, width, height):
+    #Clusters stacked top to bottom, drawn like the Tk viewer
+    total = height * max(len(layouts), 1)
+    parts = [f'<svg xmlns="http://www.w3.org/2000/svg" width="{width}" height="{total}" font-family="Arial">',
+             '<defs>',
+             '<marker id="black" markerWidth="12" markerHeight="10" refX="12" refY="5" orient="auto"><path d="M0,0 L12,5 L0,10 z" fill="black"/></marker>',
+             '<marker id="gray" markerWidth="12" markerHeight="10" refX="12" refY="5" orient="auto"><path d="M0,0 L12,5 L0,10 z" fill="gray"/></marker>',
+             '</defs>',
+             f'<rect width="{width}" height="{total}" fill="white"/>']
+    if not layouts:
+        parts.append(f'<text x="{width / 2}" y="{height / 2}" text-anchor="middle">No cluster with both sensor and action found.</text>')
+    for i, (cluster_nodes, cluster_edges, positions) in enumerate(layouts):
+        parts.append(f'<g transform="translate(0,{i * height})">')
+        for edge in cluster_edges:
+            src, tgt = edge
+            ends = edge_endpoints(positions[src], positions[tgt])
+            if ends is None:
+                continue
+            weight = weights[edge]
+            color = "black" if weight >= 0 else "gray"
+            thickness = max(1, int(abs(weight) * 3))
+            x1, y1 = positions[src]
+            x2, y2 = positions[tgt]
+            parts.append(f'<line x1="{ends[0]:.1f}" y1="{ends[1]:.1f}" x2="{ends[2]:.1f}" y2="{ends[3]:.1f}" '
+                         f'stroke="{color}" stroke-width="{thickness}" marker-end="url(#{color})"/>')
+            parts.append(f'<text x="{(x1 + x2) / 2 - (y2 - y1) * 0.01:.1f}" y="{(y1 + y2) / 2 + (x2 - x1) * 0.01:.1f}" '
+                         f'font-size="8" fill="{color}" text-anchor="middle">{weight:.2f}</text>')
+        for node in cluster_nodes:
+            x, y = positions[node]
+            parts.append(f'<circle cx="{x:.1f}" cy="{y:.1f}" r="{NODE_RADIUS}" fill="{TYPE_COLORS[node[0]]}" stroke="black"/>')
+            parts.append(f'<text x="{x:.1f}" y="{y + 3:.1f}" font-size="9" font-weight="bold" text-anchor="middle">{node[1]}</text>')
+        parts.append('</g>')
+    parts.append('</svg>')
+    return "\n".join(parts) + "\n"
+
+def layout_json(layouts, weights):
+    return [{"nodes": [{"type": node[0], "id": node[1], "x": positions[node][0], "y": positions[node][1]} for node in cluster_nodes],
+             "edges": [{"source": list(src), "target": list(tgt), "weight": weights[(src, tgt)]} for src, tgt in cluster_edges]}
+            for cluster_nodes, cluster_edges, positions in layouts]
+
+def parse_generations(text):
+    #"5", "0-100" or "0-100:10"
+    if text is None:
+        return None
+    span, _, stride = text.partition(":")
+    first, _, last = span.partition("-")
+    return range(int(first), int(last or first) + 1, int(stride or 1))
+
+def main():
+    parser = argparse.ArgumentParser(description="Write network diagrams for the genomes in a generation log, without Tk")
+    parser.add_argument("file", nargs="?", default=settings.log_file)
+    parser.add_argument("--output-dir", default="diagrams")
+    parser.add_argument("--format", nargs="+", choices=("svg", "json"), default=["svg", "json"])
+    parser.add_argument("--generations", help="a generation, a range like 0-100, or a range with a stride like 0-100:10")
+    parser.add_argument("--survivors", action="store_true", help="also draw every logged survivor genome")
+    parser.add_argument("--width", type=int, default=1200)
+    parser.add_argument("--height", type=int, default=1000)
+    args = parser.parse_args()
+    generations = parse_generations(args.generations)
+    os.makedirs(args.output_dir, exist_ok=True)
+    written = 0
+    for record in read_generation_log(args.file):
+        generation = record["generation"]
+        if generations is not None and generation not in generations:
+            continue
+        genomes = [("example", record["example_genome"])]
+        if args.survivors:
+            genomes += [(f"survivor{i}", genome) for i, genome in enumerate(record.get("survivor_genomes", []))]
+        for name, genome in genomes:
+            _, _, weights = build_graph(genome)
+            layouts = layout_genome(genome, args.width, args.height, random.Random(generation))
+            stem = os.path.join(args.output_dir, f"generation{generation:05d}_{name}")
+            if "svg" in args.format:
+                with open(stem + ".svg", "w") as f:
+                    f.write(render_svg(layouts, weights, args.width, args.height))
+            if "json" in args.format:
+                with open(stem + ".json", "w") as f:
+                    json.dump({"generation": generation, "genome": name, "clusters": layout_json(layouts, weights)}, f)
+            written += 1
+    print(f"Wrote diagrams for {written} genomes to {args.output_dir}")
+
+if __name__ == "__main__":
+    main()
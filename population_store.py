@@ -0,0 +1,73 @@
+import numpy as np
+
+def action_moves(actions):
+    dx = (actions[:, 0] > 0.5).astype(np.int64) - (actions[:, 0] < -0.5)
+    dy = (actions[:, 1] > 0.5).astype(np.int64) - (actions[:, 1] < -0.5)
+    if actions.shape[1] > 2:
+        stop = actions[:, 2] > 0.8
+        dx[stop] = 0
+        dy[stop] = 0
+    return dx, dy
+
+class PopulationStore:
+    #Positions and last moves of a whole population in contiguous arrays
+    ARRAYS = ('x', 'y', 'last_dx', 'last_dy', 'ids')
+
+    def __init__(self, size):
+        self.x = np.zeros(size, dtype=np.int64)
+        self.y = np.zeros(size, dtype=np.int64)
+        self.last_dx = np.zeros(size, dtype=np.int64)
+        self.last_dy = np.zeros(size, dtype=np.int64)
+        self.ids = np.zeros(size, dtype=np.int64)
+        self.sensor_usage = None
+        self.lists = None
+
+    def __len__(self):
+        return len(self.x)
+
+    @classmethod
+    def adopt(cls, population):
+        #A population already laid out in one store, e.g. by the checkpoint loader, keeps it
+        store = population[0].store if population else None
+        if store is not None and len(store) == len(population) and all(
+                ind.store is store and ind.index == index for index, ind in enumerate(population)):
+            return store
+        store = cls(len(population))
+        for index, ind in enumerate(population):
+            store.x[index], store.y[index] = ind.x, ind.y
+            store.last_dx[index], store.last_dy[index] = ind.last_dx, ind.last_dy
+            store.ids[index] = ind.id
+            ind.store, ind.index = store, index
+        return store
+
+    @classmethod
+    def stack(cls, stores):
+        #One store over several, end to end; each store's arrays become views of its slice, so its individuals follow
+        combined = cls(sum(len(store) for store in stores))
+        start = 0
+        for store in stores:
+            stop = start + len(store)
+            for name in cls.ARRAYS:
+                array = getattr(combined, name)
+                array[start:stop] = getattr(store, name)
+                setattr(store, name, array[start:stop])
+            start = stop
+        return combined
+
+    def open_lists(self):
+        #Plain lists of the motion arrays for the per-individual step, which reads and writes them one element at a
+        #time; close_lists copies them back
+        self.lists = self.x.tolist(), self.y.tolist(), self.last_dx.tolist(), self.last_dy.tolist()
+        return self.lists
+
+    def close_lists(self):
+        self.x[:], self.y[:], self.last_dx[:], self.last_dy[:] = self.lists
+        self.lists = None
+
+    def apply_actions(self, actions):
+        #Vectorised Simulation.move for a (population, NUM_ACTIONS) array of outputs
+        dx, dy = action_moves(actions)
+        np.clip(self.x + dx, 1, 99, out=self.x)
+        np.clip(self.y + dy, 1, 99, out=self.y)
+        self.last_dx[:] = dx
+        self.last_dy[:] = dy
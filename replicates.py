@@ -0,0 +1,100 @@
+import argparse
+import math
+import time
+import numpy as np
+import settings
+from simulation import Simulation
+from batch_brain import BrainBatch
+from population_store import PopulationStore
+from sensors import sense_population
+
+class ReplicateSet:
+    #Independent simulations advanced in lockstep: positions are stacked as (replicate, individual), and each
+    #step senses, activates and moves all of them at once. Every replicate keeps its own seed, survivors and generation
+    def __init__(self, seeds):
+        if settings.PACKED_GENOME:
+            raise ValueError("replicates need per-slot seeded reproduction, which packed genomes do not use")
+        if settings.WRITE_GENOME or settings.WRITE_LINEAGE:
+            raise ValueError("replicates would all append to the same generation log and lineage file; "
+                             "turn off WRITE_GENOME and WRITE_LINEAGE")
+        self.simulations = [Simulation(seed=seed) for seed in seeds]
+        self.stack()
+
+    def __len__(self):
+        return len(self.simulations)
+
+    def stack(self):
+        #Reproduction gives every replicate a fresh store, so the stack is rebuilt after each generation
+        self.store = PopulationStore.stack([sim.store for sim in self.simulations])
+        self.store.sensor_usage = frozenset().union(*(sim.store.sensor_usage for sim in self.simulations))
+        self.brain_batch = None
+
+    def step(self):
+        if self.brain_batch is None:
+            self.brain_batch = BrainBatch(ind.brain for sim in self.simulations for ind in sim.population)
+        store = self.store
+        shape = (len(self.simulations), -1)
+        sensors = sense_population(store.x.reshape(shape), store.y.reshape(shape), store.last_dx.reshape(shape),
+                                   store.last_dy.reshape(shape), self.simulations[0].current_step, store.sensor_usage)
+        store.apply_actions(self.brain_batch.activate(sensors.reshape(-1, settings.NUM_SENSES)))
+
+    def update(self, generation_steps):
+        self.step()
+        ended = False
+        for sim in self.simulations:
+            sim.current_step += 1
+            if sim.current_step >= generation_steps:
+                sim.end_generation()
+                ended = True
+        if ended:
+            self.stack()
+
+    def evolve(self, generations):
+        #Survival rate per replicate and generation, shape (replicates, generations)
+        survival_rates = np.zeros((len(self.simulations), generations))
+        for generation in range(generations):
+            for _ in range(settings.GENERATION_STEPS):
+                self.update(settings.GENERATION_STEPS)
+            survival_rates[:, generation] = [sim.survival_rate for sim in self.simulations]
+        return survival_rates
+
+    def close(self):
+        for sim in self.simulations:
+            sim.close()
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Run independent replicates of one setting together in a single process")
+    parser.add_argument("--replicates", type=int, default=16)
+    parser.add_argument("--generations", type=int, default=20)
+    parser.add_argument("--population", type=int, default=settings.POPULATION_SIZE)
+    parser.add_argument("--steps", type=int, default=settings.GENERATION_STEPS)
+    parser.add_argument("--seed", type=int, default=0, help="replicate i is seeded with seed + i")
+    parser.add_argument("--output", help="write the (replicates, generations) survival rates to this .npy file")
+    args = parser.parse_args()
+    if args.generations < 1:
+        parser.error("--generations must be at least 1")
+    return args
+
+def main():
+    args = parse_args()
+    settings.POPULATION_SIZE = args.population
+    settings.GENERATION_STEPS = args.steps
+    #Replicates would all write to the same files
+    settings.disable_outputs()
+    replicates = ReplicateSet(range(args.seed, args.seed + args.replicates))
+    start = time.perf_counter()
+    survival_rates = replicates.evolve(args.generations)
+    elapsed = time.perf_counter() - start
+    replicates.close()
+    for generation, rates in enumerate(survival_rates.T):
+        print(f"Generation {generation} survival mean {rates.mean()*100:.1f}% sd {rates.std()*100:.1f}% "
+              f"min {rates.min()*100:.0f}% max {rates.max()*100:.0f}%")
+    means = survival_rates.mean(axis=1)
+    spread = 1.96 * means.std(ddof=1) / math.sqrt(len(means)) if len(means) > 1 else 0.0
+    print(f"{args.replicates} replicates, {args.generations} generations in {elapsed:.2f}s")
+    print(f"Mean survival {means.mean()*100:.1f}% ± {spread*100:.1f}% (95% interval over replicates)")
+    if args.output:
+        np.save(args.output, survival_rates)
+
+if __name__ == "__main__":
+    main()
@@ -1,53 +1,39 @@
+import os
+import time
 import pygame
-import math
 import settings
 from simulation import Simulation
+from checkpoint import load_checkpoint, maybe_checkpoint
+from sensors import get_sensor_inputs, get_store_sensor_inputs
 
-def get_sensor_inputs(ind, population, step):
-    sensors = [
-        (ind.x - 50) / 50.0, #Position, 1
-        (ind.y - 50) / 50.0] #2
-    sensors.extend([
-        ind.last_dx, #Last movement, 3
-        ind.last_dy, #4
-        step/settings.GENERATION_STEPS]) #Step count, 5
-    #Nearest neighbor detection
-    closest_distance = 1.0
-    angle_normalized = 0.0
-    nearby_count = 0
-    for other in population:
-        if other != ind:
-            dx = other.x - ind.x
-            dy = other.y - ind.y
-            distance = math.sqrt(dx*dx + dy*dy)
-            # Count individuals within 10-unit range
-            if distance <= 15:
-                nearby_count += 1
-            # Normalize distance for nearest neighbor calculation
-            normalized_distance = distance / math.sqrt(98**2 + 98**2)
-            if normalized_distance < closest_distance:
-                closest_distance = normalized_distance
-                if normalized_distance > 0.01: #Only calculate angle if meaningful distance
-                    angle = math.atan2(dy, dx) #Returns radians
-                    angle_normalized = angle / math.pi #Normalized to [-1, 1]
-    sensors.extend([
-        1.0 - closest_distance, #Distance to nearest neighbor (0=far, 1=touching), 6
-        angle_normalized, #Direction to nearest neighbor, 7
-        nearby_count / settings.POPULATION_SIZE]) #Normalized count of nearby individuals, 8
-    if settings.WRITE_SENSOR_OUTPUT: print(sensors)
-    return sensors
+def make_dot_sprite():
+    dot = pygame.Surface((11, 11), pygame.SRCALPHA)
+    pygame.draw.circle(dot, (0, 0, 0), (5, 5), 5)
+    return dot
+
+def draw_population(screen, dot, population):
+    screen.fill((255, 255, 255))
+    screen.blits([(dot, (int(ind.x * 8) - 5, int(ind.y * 8) - 5)) for ind in population], doreturn=False)
+    pygame.display.flip()
 
 def main():
-    if settings.WRITE_GENOME:
-        with open(settings.log_file, "w"):
-            pass
     pygame.init()
     screen = pygame.display.set_mode((800, 800))
     clock = pygame.time.Clock()
-    sim = Simulation()
+    dot = make_dot_sprite()
+    frame_interval = 1.0 / settings.RENDER_FPS
+    if settings.RESUME and os.path.exists(settings.checkpoint_file):
+        sim = load_checkpoint(settings.checkpoint_file)
+    else:
+        if settings.WRITE_GENOME:
+            with open(settings.log_file, "w"):
+                pass
+        sim = Simulation()
     running = True
     generation_steps = settings.GENERATION_STEPS
     visual_mode = settings.VISUAL_MODE
+    sensor_callback = lambda ind: get_sensor_inputs(ind, sim.population, sim.current_step, ind.brain.sensor_usage)
+    store_sensor_callback = lambda store: get_store_sensor_inputs(store, sim.current_step)
     while running:
         for event in pygame.event.get():
             if event.type == pygame.QUIT:
@@ -55,21 +41,25 @@ def main():
             elif event.type == pygame.KEYDOWN:
                 if event.key == pygame.K_v:
                     visual_mode = not visual_mode
-        if visual_mode:
-            sim.update(generation_steps, sensor_callback=lambda ind: get_sensor_inputs(ind, sim.population, sim.current_step))
-            screen.fill((255, 255, 255))
-            for ind in sim.population:
-                pygame.draw.circle(screen, (0, 0, 0), (int(ind.x * 8), int(ind.y * 8)), 5)
-            pygame.display.flip()
+        if visual_mode and settings.DECOUPLED_RENDER:
+            #Step at full speed until the next frame is due, then draw one snapshot
+            frame_due = time.perf_counter() + frame_interval
+            while time.perf_counter() < frame_due:
+                sim.update(generation_steps, sensor_callback=sensor_callback, store_sensor_callback=store_sensor_callback)
+                maybe_checkpoint(sim)
+            draw_population(screen, dot, sim.population)
+        elif visual_mode:
+            sim.update(generation_steps, sensor_callback=sensor_callback, store_sensor_callback=store_sensor_callback)
+            maybe_checkpoint(sim)
+            draw_population(screen, dot, sim.population)
             clock.tick(settings.SPEED)
         else:
-            sim.update(generation_steps, sensor_callback=lambda ind: get_sensor_inputs(ind, sim.population, sim.current_step))
+            sim.update(generation_steps, sensor_callback=sensor_callback, store_sensor_callback=store_sensor_callback)
+            maybe_checkpoint(sim)
             if True:
                 if sim.current_step == settings.GENERATION_STEPS-1:
-                    screen.fill((255, 255, 255))
-                    for ind in sim.population:
-                        pygame.draw.circle(screen, (0, 0, 0), (int(ind.x * 8), int(ind.y * 8)), 5)
-                    pygame.display.flip()
+                    draw_population(screen, dot, sim.population)
+    sim.close()
     pygame.quit()
 
 if __name__ == "__main__":
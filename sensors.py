@@ -0,0 +1,185 @@
+import math
+import numpy as np
+import settings
+from instrumentation import profiler
+
+NEIGHBOR_SENSES = frozenset((5, 6, 7))
+
+def get_sensor_inputs(ind, population, step, needed=None):
+    #needed: sense indices the caller reads; neighbor senses are skipped when none are needed
+    store = ind.store
+    lists = store.lists
+    if lists is not None:
+        #Inside a per-individual step the store's open lists hold the current positions
+        x, y = lists[0][ind.index], lists[1][ind.index]
+        last_dx, last_dy = lists[2][ind.index], lists[3][ind.index]
+    else:
+        x, y, last_dx, last_dy = ind.x, ind.y, ind.last_dx, ind.last_dy
+    sensors = [
+        (x - 50) / 50.0, #Position, 1
+        (y - 50) / 50.0] #2
+    sensors.extend([
+        last_dx, #Last movement, 3
+        last_dy, #4
+        step/settings.GENERATION_STEPS]) #Step count, 5
+    #Nearest neighbor detection
+    closest_distance = 1.0
+    angle_normalized = 0.0
+    nearby_count = 0
+    if needed is not None and not needed & NEIGHBOR_SENSES:
+        population = ()
+    elif profiler.enabled:
+        profiler.count("neighbor_pairs", len(population) - 1)
+    if not population:
+        xs, ys, me = (), (), -1
+    elif len(population) == len(store) and population[ind.index] is ind:
+        #The population laid out in ind's store: read positions straight from it
+        xs, ys = (lists[0], lists[1]) if lists is not None else (store.x.tolist(), store.y.tolist())
+        me = ind.index
+    else:
+        xs = [other.x for other in population]
+        ys = [other.y for other in population]
+        me = next((i for i, other in enumerate(population) if other is ind), -1)
+    for i, (other_x, other_y) in enumerate(zip(xs, ys)):
+        if i != me:
+            dx = other_x - x
+            dy = other_y - y
+            distance = math.sqrt(dx*dx + dy*dy)
+            # Count individuals within 10-unit range
+            if distance <= 15:
+                nearby_count += 1
+            # Normalize distance for nearest neighbor calculation
+            normalized_distance = distance / math.sqrt(98**2 + 98**2)
+            if normalized_distance < closest_distance:
+                closest_distance = normalized_distance
+                if normalized_distance > 0.01: #Only calculate angle if meaningful distance
+                    angle = math.atan2(dy, dx) #Returns radians
+                    angle_normalized = angle / math.pi #Normalized to [-1, 1]
+    sensors.extend([
+        1.0 - closest_distance, #Distance to nearest neighbor (0=far, 1=touching), 6
+        angle_normalized, #Direction to nearest neighbor, 7
+        nearby_count / settings.POPULATION_SIZE]) #Normalized count of nearby individuals, 8
+    if settings.WRITE_SENSOR_OUTPUT: print(sensors)
+    return sensors
+
+DIAGONAL = math.sqrt(98**2 + 98**2)
+NEARBY_RADIUS = 15
+BRUTE_FORCE_LIMIT = 256
+_ring_cache = {}
+
+def get_population_sensor_inputs(population, step, needed=None):
+    x = np.array([ind.x for ind in population])
+    y = np.array([ind.y for ind in population])
+    last_dx = np.array([ind.last_dx for ind in population])
+    last_dy = np.array([ind.last_dy for ind in population])
+    sensors = sense_population(x, y, last_dx, last_dy, step, needed).tolist()
+    if settings.WRITE_SENSOR_OUTPUT:
+        for row in sensors:
+            print(row)
+    return sensors
+
+def get_store_sensor_inputs(store, step):
+    sensors = sense_population(store.x, store.y, store.last_dx, store.last_dy, step, store.sensor_usage)
+    if settings.WRITE_SENSOR_OUTPUT:
+        for row in sensors.tolist():
+            print(row)
+    return sensors
+
+def sense_population(x, y, last_dx, last_dy, step, needed=None, rows=slice(None)):
+    #Same senses as get_sensor_inputs, computed from one snapshot of positions for the individuals in rows.
+    #Leading axes hold separate worlds, e.g. (replicates, population); neighbors are only found within a world
+    count = x.shape[-1]
+    own_x, own_y = x[..., rows], y[..., rows]
+    sensors = np.zeros(own_x.shape + (settings.NUM_SENSES,))
+    sensors[..., 0] = (own_x - 50) / 50.0
+    sensors[..., 1] = (own_y - 50) / 50.0
+    sensors[..., 2] = last_dx[..., rows]
+    sensors[..., 3] = last_dy[..., rows]
+    sensors[..., 4] = step / settings.GENERATION_STEPS
+    if needed is not None and not needed & NEIGHBOR_SENSES:
+        return sensors
+    if count < 2:
+        return sensors
+    if count <= BRUTE_FORCE_LIMIT:
+        if profiler.enabled:
+            profiler.count("neighbor_pairs", own_x.size * (count - 1))
+        distance, nearest, nearby_count = neighbors_brute_force(x, y, rows)
+    else:
+        find_nearest = needed is None or 5 in needed or 6 in needed
+        #The lattice holds one world, so worlds are searched one after another
+        worlds = [neighbors_grid(wx, wy, find_nearest, rows) for wx, wy in zip(x.reshape(-1, count), y.reshape(-1, count))]
+        distance, nearest, nearby_count = (np.stack(part).reshape(own_x.shape) for part in zip(*worlds))
+    closest_distance = np.minimum(distance / DIAGONAL, 1.0)
+    #Angle is only meaningful for a distinct, not overlapping, nearest neighbor
+    has_angle = (closest_distance > 0.01) & (closest_distance < 1.0)
+    index = np.nonzero(has_angle)
+    other = index[:-1] + (nearest[index],)
+    sensors[index + (6,)] = np.arctan2(y[other] - own_y[index], x[other] - own_x[index]) / math.pi
+    sensors[..., 5] = 1.0 - closest_distance
+    sensors[..., 7] = nearby_count / settings.POPULATION_SIZE
+    return sensors
+
+def neighbors_brute_force(x, y, rows=slice(None)):
+    dx = x[..., None, :] - x[..., rows, None]
+    dy = y[..., None, :] - y[..., rows, None]
+    distance = np.sqrt(dx * dx + dy * dy)
+    own = np.arange(x.shape[-1])[rows]
+    distance[..., np.arange(len(own)), own] = np.inf
+    nearest = distance.argmin(axis=-1)
+    nearby_count = (distance <= NEARBY_RADIUS).sum(axis=-1)
+    return np.take_along_axis(distance, nearest[..., None], axis=-1)[..., 0], nearest, nearby_count
+
+def neighbors_grid(x, y, find_nearest=True, rows=slice(None)):
+    #Positions are integers in 0..100, so the grid has one bucket per lattice point.
+    #Everyone is bucketed, but only the individuals in rows are searched from
+    x = np.asarray(x, dtype=np.intp)
+    y = np.asarray(y, dtype=np.intp)
+    count = len(x)
+    pad = 100
+    size = 101 + 2 * pad
+    occupancy = np.zeros((size, size), dtype=np.intp)
+    np.add.at(occupancy, (x + pad, y + pad), 1)
+    first_index = np.full((size, size), count, dtype=np.intp)
+    np.minimum.at(first_index, (x + pad, y + pad), np.arange(count))
+    own = np.arange(count)[rows]
+    px, py = x[rows] + pad, y[rows] + pad
+    #Disk sums from row prefix sums: one gather per column offset
+    prefix = np.zeros((size, size + 1), dtype=np.intp)
+    np.cumsum(occupancy, axis=1, out=prefix[:, 1:])
+    nearby_count = np.full(len(own), -1, dtype=np.intp)
+    for ox in range(-NEARBY_RADIUS, NEARBY_RADIUS + 1):
+        w = math.isqrt(NEARBY_RADIUS * NEARBY_RADIUS - ox * ox)
+        nearby_count += prefix[px + ox, py + w + 1] - prefix[px + ox, py - w]
+    distance = np.full(len(own), np.inf)
+    nearest = np.zeros(len(own), dtype=np.intp)
+    shared = occupancy[px, py] > 1
+    distance[shared] = 0.0
+    #Overlapping neighbors get no angle, so their identity is not needed
+    nearest[shared] = own[shared]
+    pending = np.flatnonzero(~shared) if find_nearest else np.empty(0, dtype=np.intp)
+    for d2, ox, oy in lattice_rings():
+        if not len(pending):
+            break
+        if profiler.enabled:
+            profiler.count("neighbor_pairs", len(pending) * len(ox))
+        candidates = first_index[px[pending, None] + ox, py[pending, None] + oy].min(axis=1)
+        found = candidates < count
+        resolved = pending[found]
+        distance[resolved] = math.sqrt(d2)
+        nearest[resolved] = candidates[found]
+        pending = pending[~found]
+    return distance, nearest, nearby_count
+
+def lattice_rings(limit=100):
+    if limit not in _ring_cache:
+        ox, oy = np.meshgrid(np.arange(-limit, limit + 1), np.arange(-limit, limit + 1), indexing='ij')
+        ox, oy = ox.ravel(), oy.ravel()
+        d2 = ox * ox + oy * oy
+        keep = (d2 > 0) & (d2 <= limit * limit * 2)
+        ox, oy, d2 = ox[keep], oy[keep], d2[keep]
+        order = np.argsort(d2, kind='stable')
+        ox, oy, d2 = ox[order], oy[order], d2[order]
+        starts = np.flatnonzero(np.r_[True, d2[1:] != d2[:-1]])
+        ends = np.r_[starts[1:], len(d2)]
+        _ring_cache[limit] = [(int(d2[s]), ox[s:e], oy[s:e]) for s, e in zip(starts, ends)]
+    return _ring_cache[limit]
@@ -1,17 +1,53 @@
 VISUAL_MODE = True
+DECOUPLED_RENDER = False #Simulate at full speed and draw snapshots at RENDER_FPS instead of one frame per step at SPEED
+RENDER_FPS = 30
+BATCH_BRAIN = False
+PACKED_GENOME = False
+BRAIN_CACHE_SIZE = 4096 #Compiled brains kept for reuse, 0 disables
+COMPILE_BRAINS = False #Run brains through generated straight-line code, see brain_compiler.py
+EVALUATION_MODE = 'synchronous' #'topological' evaluates acyclic brains once per step in dependency order
+EARLY_TERMINATION = False #End a generation once positions, last moves and neuron state stop changing
+BRAIN_MEMO_SIZE = 256 #Remembered activations per state-independent brain, 0 disables
 TEST = False
 PRINT_GENOME = False
+PRINT_GENERATION = True
+PROFILE = False #Per-phase timers and counters in the generation summary
 WRITE_GENOME = True
 WRITE_SENSOR_OUTPUT = False
 SENSOR = 0
 NEURON = 1
 ACTION = 2
-NUM_SENSES = 8 #Needs to match sensor_inputs in `run`
+NUM_SENSES = 8 #Needs to match sensors.get_sensor_inputs and sensors.get_population_sensor_inputs
 NUM_ACTIONS = 3 #Should match action steps in `simulation`
-log_file = 'log.txt'
+log_file = 'log.jsonl.gz' #One gzipped JSON line per generation
+LOG_SURVIVOR_GENOMES = False
+LOG_QUEUE_SIZE = 64
+lineage_file = 'lineage.bin'
+WRITE_LINEAGE = False #Parent id and mutation delta of every individual, see lineage.py
+LINEAGE_KEYFRAME_INTERVAL = 32 #Generations between full genomes along a line of descent
+checkpoint_file = 'checkpoint.bin'
+CHECKPOINT_INTERVAL = 0 #Generations between checkpoints, 0 disables
+RESUME = False
+SEED = None #Derive a random stream per child slot from (SEED, generation, slot) instead of the global random state
+REPRODUCTION_WORKERS = 0 #Processes building offspring when SEED is set, 0 or 1 builds them in-process
+STEP_WORKERS = 0 #Processes sharing every step of one population through shared memory, see shared_step.py; 0 or 1 steps in-process
+STEP_WORKER_TIMEOUT = 120 #Seconds the parent waits on step workers before giving up on them
 MAX_NEURONS = 20
 GENOME_LENGTH = 40
 POPULATION_SIZE = 3 if TEST else 20
 SPEED = 8 if TEST else 80
 GENERATION_STEPS = 100
 MUTATION_RATE = 0.8
+
+def snapshot():
+    #Every setting above by name, for worker processes that start from a fresh import
+    return {name: value for name, value in globals().items() if not name.startswith('_') and not callable(value)}
+
+def apply(values):
+    globals().update(values)
+
+def disable_outputs():
+    #For runs driven from another loop: no per-generation line, generation log, lineage file or checkpoints
+    global PRINT_GENERATION, WRITE_GENOME, WRITE_LINEAGE, CHECKPOINT_INTERVAL
+    PRINT_GENERATION = WRITE_GENOME = WRITE_LINEAGE = False
+    CHECKPOINT_INTERVAL = 0
@@ -0,0 +1,182 @@
+import atexit
+import threading
+import multiprocessing as mp
+from multiprocessing import shared_memory
+import numpy as np
+import settings
+from brain import Brain
+from batch_brain import BrainBatch
+from population_store import action_moves
+from sensors import sense_population
+
+FIELDS = ('x', 'y', 'last_dx', 'last_dy')
+#Control words, written by the parent before the barrier that starts a round: command, step, buffer holding the current state
+STEP, LOAD, STOP, GATHER = 0, 1, 2, 3
+CONTROL_WORDS = 3
+
+def views(memory, size):
+    buffers = np.ndarray((2, len(FIELDS), size), dtype=np.int64, buffer=memory.buf)
+    control = np.ndarray(CONTROL_WORDS, dtype=np.int64, buffer=memory.buf, offset=buffers.nbytes)
+    return buffers, control
+
+def step_worker(name, size, rows, barrier, conn, values):
+    settings.apply(values)
+    memory = shared_memory.SharedMemory(name=name)
+    buffers, control = views(memory, size)
+    batch = None
+    usage = None
+    #Workers wait without a timeout, since the parent spends selection and reproduction between steps; a worker that
+    #fails breaks the barrier so the parent hears of it at once, and a parent that gives up breaks it for the workers
+    try:
+        while True:
+            barrier.wait()
+            command, step, current = control.tolist()
+            if command == STOP:
+                break
+            if command == LOAD:
+                genomes, neurons, usage = conn.recv()
+                brains = []
+                for genome, state in zip(genomes, neurons):
+                    brain = Brain(genome)
+                    brain.neurons = state
+                    brains.append(brain)
+                batch = BrainBatch(brains)
+            elif command == GATHER:
+                batch.store_neurons()
+                conn.send([brain.neurons for brain in batch.brains])
+            else:
+                #Everyone's positions from the previous step in, this slice's moves out to the other buffer
+                x, y, last_dx, last_dy = buffers[current]
+                sensors = sense_population(x, y, last_dx, last_dy, step, usage, rows)
+                dx, dy = action_moves(batch.activate(sensors))
+                target = buffers[1 - current]
+                target[0, rows] = np.clip(x[rows] + dx, 1, 99)
+                target[1, rows] = np.clip(y[rows] + dy, 1, 99)
+                target[2, rows] = dx
+                target[3, rows] = dy
+            barrier.wait()
+    except threading.BrokenBarrierError:
+        pass
+    except BaseException:
+        barrier.abort()
+        raise
+    finally:
+        del buffers, control
+        memory.close()
+        conn.close()
+
+class SharedStepper:
+    #One population split into contiguous slices, one per worker process. Positions and last moves live in shared
+    #memory, double buffered: a step reads everyone from one buffer and writes every slice to the other, so no slice
+    #sees a move from the same step and the result does not depend on the number of workers
+    def __init__(self, workers, size):
+        self.size = size
+        self.memory = shared_memory.SharedMemory(create=True, size=(2 * len(FIELDS) * size + CONTROL_WORDS) * 8)
+        self.buffers, self.control = views(self.memory, size)
+        self.current = 0
+        self.population = None
+        self.store = None
+        chunk = -(-size // max(1, min(workers, size)))
+        self.slices = [slice(start, min(start + chunk, size)) for start in range(0, size, chunk)]
+        self.barrier = mp.Barrier(len(self.slices) + 1)
+        values = settings.snapshot()
+        self.connections, self.workers = [], []
+        for rows in self.slices:
+            parent_conn, child_conn = mp.Pipe()
+            worker = mp.Process(target=step_worker, args=(self.memory.name, size, rows, self.barrier, child_conn, values), daemon=True)
+            worker.start()
+            self.connections.append(parent_conn)
+            self.workers.append(worker)
+        self.closed = False
+        atexit.register(self.close)
+
+    def wait(self):
+        try:
+            self.barrier.wait(settings.STEP_WORKER_TIMEOUT)
+        except threading.BrokenBarrierError:
+            dead = [str(index) for index, worker in enumerate(self.workers) if not worker.is_alive()]
+            self.abort()
+            reason = f"step worker {', '.join(dead)} exited" if dead else f"no step finished within {settings.STEP_WORKER_TIMEOUT}s"
+            raise RuntimeError(f"Shared stepping stopped: {reason}") from None
+
+    def round(self, command, step=0):
+        self.control[:] = command, step, self.current
+        self.wait()
+
+    def load(self, population, store):
+        #New brains for every worker, and the population's positions as the current state
+        self.buffers[self.current] = [getattr(store, name) for name in FIELDS]
+        self.round(LOAD)
+        #Sent after the barrier, once every worker is reading its pipe
+        try:
+            for conn, rows in zip(self.connections, self.slices):
+                conn.send(([ind.genome for ind in population[rows]], [ind.brain.neurons for ind in population[rows]], store.sensor_usage))
+        except OSError:
+            self.barrier.abort()
+        self.wait()
+        self.population = population
+        self.bind(store)
+
+    def step(self, step):
+        self.round(STEP, step)
+        self.wait()
+        self.current = 1 - self.current
+        self.bind(self.store)
+
+    def store_neurons(self):
+        #Neuron state lives in the workers while a population is loaded; this copies it back to the parent's brains
+        if self.population is None or self.closed:
+            return
+        self.round(GATHER)
+        try:
+            states = [state for conn in self.connections for state in conn.recv()]
+        except (OSError, EOFError):
+            self.barrier.abort()
+        self.wait()
+        for ind, state in zip(self.population, states):
+            ind.brain.neurons = state
+
+    def bind(self, store):
+        #The store reads the current buffer; a store left behind keeps a copy of its last state
+        if self.store is not None and self.store is not store:
+            self.release()
+        self.store = store
+        for i, name in enumerate(FIELDS):
+            setattr(store, name, self.buffers[self.current, i])
+
+    def release(self):
+        for name in FIELDS:
+            setattr(self.store, name, getattr(self.store, name).copy())
+        self.store = None
+
+    def close(self):
+        if self.closed:
+            return
+        self.store_neurons()
+        self.closed = True
+        self.round(STOP)
+        for worker in self.workers:
+            worker.join()
+        self.free()
+
+    def abort(self):
+        #A worker failed or stopped answering: stop the rest and give the shared memory back
+        if self.closed:
+            return
+        self.closed = True
+        self.barrier.abort()
+        for worker in self.workers:
+            worker.join(1)
+            if worker.is_alive():
+                worker.terminate()
+                worker.join()
+        self.free()
+
+    def free(self):
+        for conn in self.connections:
+            conn.close()
+        if self.store is not None:
+            self.release()
+        del self.buffers, self.control
+        self.memory.close()
+        self.memory.unlink()
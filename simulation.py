@@ -1,78 +1,352 @@
 import random
+import multiprocessing as mp
+from time import perf_counter_ns
+import numpy as np
 import settings
 from individual import Individual
-from genome import reproduce_genome
+from genome import make_random_genome, reproduce_genome, make_random_genomes, reproduce_genomes, unpack_genome
+from brain import Brain
+from batch_brain import BrainBatch
+from log_stream import GenerationLog, generation_record
+from instrumentation import profiler, format_summary
+from population_store import PopulationStore
+from lineage import LineageStore
+from shared_step import SharedStepper
+
+def slot_rng(seed, generation, slot):
+    #String seeds are hashed with SHA-512, so the stream is the same in every process and run
+    return random.Random(f"{seed}:{generation}:{slot}")
+
+def make_offspring(seed, generation, slots, parent_genomes):
+    #(parent index, genome, delta, x, y) per slot, drawn only from that slot's stream
+    offspring = []
+    for slot in slots:
+        rng = slot_rng(seed, generation, slot)
+        parent = rng.randrange(len(parent_genomes))
+        delta = []
+        genome = reproduce_genome(parent_genomes[parent], delta, rng)
+        offspring.append((parent, genome, delta, rng.randint(5, 95), rng.randint(5, 95)))
+    return offspring
+
+STEP_SENSE = 4
 
 class Simulation:
-    def __init__(self):
+    def __init__(self, population=None, seed=None, registered=False):
+        #A seed of its own lets several simulations share a process without sharing a stream.
+        #registered: the population already carries ids, e.g. from a checkpoint, and is not recorded again
+        self.seed = settings.SEED if seed is None else seed
         self.generation = 0
         self.current_step = 0
         self.survival_rate = 0
         self.training_stage = 0
-        self.init_population()
+        self.brain_batch = None
+        self.survivors = []
+        self.pool = None
+        self.stepper = None
+        self.skipped_steps = 0
+        self.total_skipped_steps = 0
+        self.log = GenerationLog(settings.log_file) if settings.WRITE_GENOME else None
+        self.lineage = LineageStore(settings.lineage_file) if settings.WRITE_LINEAGE else None
+        self.next_id = self.lineage.next_id if self.lineage else 0
+        if population is None:
+            self.init_population()
+        else:
+            self.population = population
+            self.store = PopulationStore.adopt(population)
+        if registered:
+            self.next_id = max(self.next_id, int(self.store.ids.max(initial=-1)) + 1)
+        else:
+            for ind in self.population:
+                self.register(ind)
+        self.population_changed()
 
     def init_population(self):
         self.population = []
-        for _ in range(settings.POPULATION_SIZE):
-            ind = Individual(x=random.randint(5, 95), y=random.randint(5, 95))
+        self.store = PopulationStore(settings.POPULATION_SIZE)
+        if self.seed is not None and not settings.PACKED_GENOME:
+            for index in range(settings.POPULATION_SIZE):
+                rng = slot_rng(self.seed, "init", index)
+                genome = make_random_genome(rng)
+                ind = Individual(x=rng.randint(5, 95), y=rng.randint(5, 95), genome=genome, store=self.store, index=index)
+                self.population.append(ind)
+            return
+        genomes = make_random_genomes(settings.POPULATION_SIZE) if settings.PACKED_GENOME else [None] * settings.POPULATION_SIZE
+        for index, genome in enumerate(genomes):
+            ind = Individual(x=random.randint(5, 95), y=random.randint(5, 95), genome=genome, store=self.store, index=index)
             self.population.append(ind)
 
-    def step(self, get_sensor_inputs=None):
+    def step(self, get_sensor_inputs=None, get_store_sensor_inputs=None):
+        if settings.STEP_WORKERS > 1:
+            self.step_shared()
+            return
+        if settings.BATCH_BRAIN:
+            self.step_batched(get_sensor_inputs, get_store_sensor_inputs)
+            return
+        #Individuals move one after another through plain lists, which later ones sense; the arrays are written once
+        xs, ys, _, _ = self.store.open_lists()
+        try:
+            if profiler.enabled:
+                self.step_profiled(get_sensor_inputs)
+                return
+            for ind in self.population:
+                sensor_inputs = get_sensor_inputs(ind) if get_sensor_inputs else [xs[ind.index]/100, ys[ind.index]/100]
+                self.move(ind.index, ind.update(sensor_inputs))
+        finally:
+            self.store.close_lists()
+
+    def step_profiled(self, get_sensor_inputs=None):
+        sense_ns = activate_ns = move_ns = 0
+        connections = 0
+        xs, ys, _, _ = self.store.lists
         for ind in self.population:
-            sensor_inputs = get_sensor_inputs(ind) if get_sensor_inputs else [ind.x/100, ind.y/100]
+            t0 = perf_counter_ns()
+            sensor_inputs = get_sensor_inputs(ind) if get_sensor_inputs else [xs[ind.index]/100, ys[ind.index]/100]
+            t1 = perf_counter_ns()
             actions = ind.update(sensor_inputs)
-            dx = 1 if actions[0] > 0.5 else -1 if actions[0] < -0.5 else 0
-            dy = 1 if actions[1] > 0.5 else -1 if actions[1] < -0.5 else 0
-            if len(actions) > 2 and actions[2] > 0.8:
-                dx, dy = 0, 0
-            ind.x = max(1, min(99, ind.x + dx))
-            ind.y = max(1, min(99, ind.y + dy))
-            ind.last_dx = dx
-            ind.last_dy = dy
-
-    def update(self, generation_steps, sensor_callback=None):
-        self.step(get_sensor_inputs=sensor_callback)
+            t2 = perf_counter_ns()
+            self.move(ind.index, actions)
+            t3 = perf_counter_ns()
+            sense_ns += t1 - t0
+            activate_ns += t2 - t1
+            move_ns += t3 - t2
+            connections += ind.brain.wiring.connection_count
+        profiler.add("sense", sense_ns)
+        profiler.add("activate", activate_ns)
+        profiler.add("move", move_ns)
+        profiler.count("connections", connections)
+
+    def step_batched(self, get_sensor_inputs=None, get_store_sensor_inputs=None):
+        #All individuals sense the positions from the start of the step, then move together
+        timed = profiler.enabled
+        if timed:
+            t0 = perf_counter_ns()
+        if self.brain_batch is None:
+            self.brain_batch = BrainBatch(ind.brain for ind in self.population)
+        if get_store_sensor_inputs:
+            sensor_rows = get_store_sensor_inputs(self.store)
+        else:
+            sensor_rows = [get_sensor_inputs(ind) if get_sensor_inputs else [ind.x/100, ind.y/100] for ind in self.population]
+        if timed:
+            t1 = perf_counter_ns()
+        actions = self.brain_batch.activate(sensor_rows)
+        if timed:
+            t2 = perf_counter_ns()
+        self.store.apply_actions(actions)
+        if timed:
+            profiler.add("sense", t1 - t0)
+            profiler.add("activate", t2 - t1)
+            profiler.add("move", perf_counter_ns() - t2)
+            profiler.count("connections", self.brain_batch.connection_count)
+
+    def step_shared(self):
+        #Workers sense from the store's arrays like the batched step with store sensing, so the callbacks are not used
+        timed = profiler.enabled
+        if timed:
+            t0 = perf_counter_ns()
+        if self.stepper is None:
+            self.stepper = SharedStepper(settings.STEP_WORKERS, len(self.population))
+        if self.stepper.population is not self.population:
+            self.stepper.load(self.population, self.store)
+        self.stepper.step(self.current_step)
+        if timed:
+            profiler.add("shared step", perf_counter_ns() - t0)
+
+    def move(self, index, actions):
+        #Writes into the store's open lists, see PopulationStore.open_lists
+        xs, ys, last_dx, last_dy = self.store.lists
+        dx = 1 if actions[0] > 0.5 else -1 if actions[0] < -0.5 else 0
+        dy = 1 if actions[1] > 0.5 else -1 if actions[1] < -0.5 else 0
+        if len(actions) > 2 and actions[2] > 0.8:
+            dx, dy = 0, 0
+        xs[index] = max(1, min(99, xs[index] + dx))
+        ys[index] = max(1, min(99, ys[index] + dy))
+        last_dx[index] = dx
+        last_dy[index] = dy
+
+    def update(self, generation_steps, sensor_callback=None, store_sensor_callback=None):
+        before = self.capture_state() if settings.EARLY_TERMINATION and self.may_settle() else None
+        self.step(get_sensor_inputs=sensor_callback, get_store_sensor_inputs=store_sensor_callback)
         self.current_step += 1
+        if before is not None and self.current_step < generation_steps and self.unchanged_since(before):
+            #Every later step would see the same senses and state, so skip to the end of the generation
+            self.skipped_steps = generation_steps - self.current_step
+            self.total_skipped_steps += self.skipped_steps
+            self.current_step = generation_steps
         if self.current_step >= generation_steps:
-            survivors = self.get_survivors()
-            self.survival_rate = len(survivors) / settings.POPULATION_SIZE
-            print(f"Generation {self.generation} survivors: {len(survivors)}, {self.survival_rate*100:.0f}%")
-            if settings.PRINT_GENOME or settings.WRITE_GENOME:
-                example = survivors[0] if survivors else self.population[0]
-                example_genome = example.genome
-                if settings.PRINT_GENOME:
-                    print(f"Example genome for generation {self.generation}:", example_genome)
-                if settings.WRITE_GENOME:
-                    with open(settings.log_file, "w") as f:
-                        f.write(f"Example genome for generation {self.generation}: {example_genome}\n")
-            if not survivors:
-                survivors = self.population[:]
-                if False: print("No survivors")
-            new_population = []
-            while len(new_population) < settings.POPULATION_SIZE:
-                parent = random.choice(survivors)
-                child_genome = reproduce_genome(parent.genome)
-                child = Individual(
-                    x=random.randint(5, 95),
-                    y=random.randint(5, 95),
-                    genome=child_genome)
-                new_population.append(child)
-            self.population = new_population
-            self.generation += 1
-            self.current_step = 0
+            self.end_generation()
+
+    def end_generation(self):
+        #Selection, logging and reproduction once the last step of a generation has run
+        timed = profiler.enabled
+        if timed:
+            t0 = perf_counter_ns()
+        survivors = self.get_survivors()
+        if timed:
+            profiler.add("survivors", perf_counter_ns() - t0)
+        self.survivors = survivors
+        self.survival_rate = len(survivors) / settings.POPULATION_SIZE
+        if settings.PRINT_GENOME:
+            example = survivors[0] if survivors else self.population[0]
+            print(f"Example genome for generation {self.generation}:", unpack_genome(example.genome))
+        if self.log:
+            self.log.write(generation_record(self.generation, self.survival_rate, self.population, survivors))
+        if not survivors:
+            survivors = self.population[:]
+            if False: print("No survivors")
+        if timed:
+            t0 = perf_counter_ns()
+        self.store = PopulationStore(settings.POPULATION_SIZE)
+        if settings.PACKED_GENOME:
+            self.population = self.reproduce_packed(survivors)
+        elif self.seed is not None:
+            self.population = self.reproduce_seeded(survivors)
+        else:
+            self.population = self.reproduce(survivors)
+        if timed:
+            profiler.add("reproduce", perf_counter_ns() - t0)
+            summary = profiler.end_generation(self.generation, len(self.survivors), self.survival_rate)
+        else:
+            summary = {"generation": self.generation, "survivors": len(self.survivors),
+                       "survival_rate": self.survival_rate, "phase_ns": {}, "counters": {}}
+        summary["skipped_steps"] = self.skipped_steps
+        self.skipped_steps = 0
+        if settings.PRINT_GENERATION:
+            print(format_summary(summary))
+        self.population_changed()
+        if self.lineage:
+            self.lineage.flush()
+        self.generation += 1
+        self.current_step = 0
+
+    def may_settle(self):
+        #The step count sense changes every step, so a population reading it never settles
+        usage = self.store.sensor_usage
+        #Shared stepping keeps neuron state in the workers; fetching it every step would cost more than the skip saves.
+        #Anything else that reads ind.brain.neurons mid-generation calls stepper.store_neurons first, as checkpoints do
+        return usage is not None and STEP_SENSE not in usage and settings.STEP_WORKERS <= 1
+
+    def capture_state(self):
+        #activate replaces neuron lists and arrays instead of writing into them, so references are enough
+        store = self.store
+        if settings.BATCH_BRAIN:
+            neurons = self.brain_batch.neurons if self.brain_batch is not None else None
+        else:
+            neurons = [ind.brain.neurons for ind in self.population]
+        return store.x.copy(), store.y.copy(), store.last_dx.copy(), store.last_dy.copy(), neurons
+
+    def unchanged_since(self, before):
+        x, y, last_dx, last_dy, neurons = before
+        store = self.store
+        if not (np.array_equal(x, store.x) and np.array_equal(y, store.y)
+                and np.array_equal(last_dx, store.last_dx) and np.array_equal(last_dy, store.last_dy)):
+            return False
+        if settings.BATCH_BRAIN:
+            return neurons is not None and np.array_equal(neurons, self.brain_batch.neurons)
+        return all(old == ind.brain.neurons for old, ind in zip(neurons, self.population))
+
+    def reproduce(self, survivors):
+        new_population = []
+        while len(new_population) < settings.POPULATION_SIZE:
+            parent = random.choice(survivors)
+            delta = []
+            child_genome = reproduce_genome(parent.genome, delta)
+            child = Individual(
+                x=random.randint(5, 95),
+                y=random.randint(5, 95),
+                genome=child_genome,
+                brain=Brain.from_parent(parent.brain, child_genome, delta),
+                store=self.store,
+                index=len(new_population))
+            self.register(child, parent, delta)
+            new_population.append(child)
+        return new_population
+
+    def reproduce_seeded(self, survivors):
+        #Each slot has its own stream, so any split across workers gives the same children as a serial run
+        parent_genomes = [parent.genome for parent in survivors]
+        size = settings.POPULATION_SIZE
+        workers = settings.REPRODUCTION_WORKERS
+        if workers > 1:
+            if self.pool is None:
+                self.pool = mp.Pool(workers, initializer=settings.apply, initargs=(settings.snapshot(),))
+            chunk = -(-size // workers)
+            tasks = [(self.seed, self.generation, range(start, min(start + chunk, size)), parent_genomes)
+                     for start in range(0, size, chunk)]
+            offspring = [child for part in self.pool.starmap(make_offspring, tasks) for child in part]
+        else:
+            offspring = make_offspring(self.seed, self.generation, range(size), parent_genomes)
+        new_population = []
+        for slot, (parent, genome, delta, x, y) in enumerate(offspring):
+            child = Individual(x=x, y=y, genome=genome, brain=Brain.from_parent(survivors[parent].brain, genome, delta),
+                               store=self.store, index=slot)
+            self.register(child, survivors[parent], delta)
+            new_population.append(child)
+        return new_population
+
+    def reproduce_packed(self, survivors):
+        parents = [random.choice(survivors) for _ in range(settings.POPULATION_SIZE)]
+        child_genomes = reproduce_genomes([parent.genome for parent in parents])
+        new_population = [Individual(x=random.randint(5, 95), y=random.randint(5, 95), genome=genome, store=self.store, index=index)
+                          for index, genome in enumerate(child_genomes)]
+        #No delta from the vectorised mutation, so every child is a keyframe in the lineage
+        for child, parent in zip(new_population, parents):
+            self.register(child, parent)
+        return new_population
+
+    def register(self, ind, parent=None, delta=None):
+        #Children belong to the next generation, roots and immigrants to the current one
+        ind.id = self.next_id
+        self.next_id += 1
+        if self.lineage:
+            if parent is None:
+                self.lineage.record(ind.id, -1, self.generation, ind.genome)
+            else:
+                self.lineage.record(ind.id, parent.id, self.generation + 1, ind.genome, delta)
+
+    def close(self):
+        if self.log:
+            self.log.close()
+        if self.lineage:
+            self.lineage.close()
+        if self.pool:
+            self.pool.close()
+            self.pool.join()
+            self.pool = None
+        if self.stepper:
+            self.stepper.close()
+            self.stepper = None
+
+    def replace_individuals(self, genomes):
+        slots = random.sample(range(len(self.population)), min(len(genomes), len(self.population)))
+        for slot, genome in zip(slots, genomes):
+            self.population[slot] = Individual(
+                x=random.randint(5, 95),
+                y=random.randint(5, 95),
+                genome=genome,
+                store=self.store,
+                index=slot)
+            self.register(self.population[slot])
+        self.population_changed()
+
+    def population_changed(self):
+        self.brain_batch = None
+        if self.stepper:
+            self.stepper.population = None
+        #Senses read by at least one brain; the rest are left at 0.0
+        self.store.sensor_usage = frozenset().union(*(ind.brain.sensor_usage for ind in self.population))
 
     def get_survivors(self):
-        def meets_criteria(ind):
-            #return ind.x > 75
-            return 40 < ind.x < 60
-            #if self.training_stage == 0:
-            #    return 30 < ind.x < 70
-            #elif self.training_stage == 1:
-            #    return 40 < ind.x < 60 and 20 < ind.y < 80
-            #elif self.training_stage == 2:
-            #    return 42 < ind.x < 58 and 30 < ind.y < 70
+        x = self.store.x
+        #return [self.population[i] for i in np.flatnonzero(x > 75)]
+        alive = (40 < x) & (x < 60)
+        #y = self.store.y
+        #if self.training_stage == 0:
+        #    alive = (30 < x) & (x < 70)
+        #elif self.training_stage == 1:
+        #    alive = (40 < x) & (x < 60) & (20 < y) & (y < 80)
+        #elif self.training_stage == 2:
+        #    alive = (42 < x) & (x < 58) & (30 < y) & (y < 70)
         #if self.survival_rate >= 0.95 and self.training_stage <= 2:
         #    self.training_stage += 1
         #    print(f"Set training stage to {self.training_stage}")
-        return [ind for ind in self.population if meets_criteria(ind)]
-
+        return [self.population[i] for i in np.flatnonzero(alive)]
@@ -0,0 +1,100 @@
+import argparse
+import ast
+import itertools
+import json
+import random
+import multiprocessing as mp
+import numpy as np
+import settings
+from simulation import Simulation
+from headless import evolve
+
+def run_config(task):
+    run_id, overrides, seed, generations = task
+    #Each task runs in a fresh worker process, so overrides never leak between runs
+    settings.apply(overrides)
+    settings.disable_outputs()
+    random.seed(seed)
+    #A failing configuration is reported with the results instead of ending the sweep
+    try:
+        return run_id, seed, evolve(Simulation(), generations), None
+    except Exception as error:
+        return run_id, seed, [], f"{type(error).__name__}: {error}"
+
+def grid_configs(grid):
+    names = list(grid)
+    return [dict(zip(names, values)) for values in itertools.product(*(grid[name] for name in names))]
+
+def run_sweep(configs, seeds, generations, processes=None, output=None):
+    #With an output path, whatever has finished is saved even if the sweep itself is interrupted
+    tasks = [(run_id, config, seed, generations)
+             for run_id, (config, seed) in enumerate(itertools.product(configs, seeds))]
+    names = sorted({name for config in configs for name in config})
+    columns = {"run": [], "seed": [], "generation": [], "survival_rate": []}
+    columns.update({name: [] for name in names})
+    failures = {"failed_run": [], "failed_seed": [], "failed_error": []}
+    try:
+        with mp.Pool(processes, maxtasksperchild=1) as pool:
+            for run_id, seed, survival_rates, error in pool.imap_unordered(run_config, tasks):
+                config = tasks[run_id][1]
+                if error is not None:
+                    print(f"Run {run_id} seed {seed} {config}: failed, {error}")
+                    failures["failed_run"].append(run_id)
+                    failures["failed_seed"].append(seed)
+                    failures["failed_error"].append(error)
+                    continue
+                print(f"Run {run_id} seed {seed} {config}: final survival {survival_rates[-1]*100:.0f}%")
+                for generation, rate in enumerate(survival_rates):
+                    columns["run"].append(run_id)
+                    columns["seed"].append(seed)
+                    columns["generation"].append(generation)
+                    columns["survival_rate"].append(rate)
+                    for name in names:
+                        columns[name].append(config.get(name, getattr(settings, name)))
+    finally:
+        results = {name: np.asarray(values) for name, values in columns.items()}
+        results.update((name, np.asarray(values)) for name, values in failures.items())
+        if output:
+            np.savez_compressed(output, **results)
+    return results
+
+def parse_value(text):
+    try:
+        return ast.literal_eval(text)
+    except (ValueError, SyntaxError):
+        return text
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Run settings overrides and replicate seeds across a process pool")
+    parser.add_argument("--set", action="append", default=[], metavar="NAME=V1,V2",
+                        help="grid axis over a settings constant, may be repeated")
+    parser.add_argument("--configs", help="JSON file with a list of settings override objects")
+    parser.add_argument("--seeds", type=int, nargs="+", default=[0])
+    parser.add_argument("--generations", type=int, default=20)
+    parser.add_argument("--processes", type=int, default=None)
+    parser.add_argument("--output", default="sweep_results.npz")
+    args = parser.parse_args()
+    if args.generations < 1:
+        parser.error("--generations must be at least 1")
+    grid = {}
+    for axis in args.set:
+        name, _, values = axis.partition("=")
+        grid[name] = [parse_value(value) for value in values.split(",")]
+    configs = grid_configs(grid)
+    if args.configs:
+        with open(args.configs) as f:
+            configs = [dict(config, **override) for config in configs for override in json.load(f)]
+    for config in configs:
+        for name in config:
+            if not hasattr(settings, name):
+                parser.error(f"unknown setting {name}")
+    return args, configs
+
+def main():
+    args, configs = parse_args()
+    results = run_sweep(configs, args.seeds, args.generations, args.processes, args.output)
+    failed = len(results["failed_run"])
+    print(f"{len(configs) * len(args.seeds) - failed} runs written to {args.output}" + (f", {failed} failed" if failed else ""))
+
+if __name__ == "__main__":
+    main()